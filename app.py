@@ -1,16 +1,25 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file, g, has_app_context
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 import sqlite3
 import os
 import math
+import threading
 from sqlite3 import Error
 from datetime import datetime
 
+from catalog import CatalogStore
+from db import ConnectionPool, connect
+from schema import ensure_schema
 from recommendations import MovieRecommender
+from search import (
+    SnapshotIndexCache, TitlePrefixIndex, TrigramIndex, search_media, search_media_by_ids, suggest_titles
+)
+from workers import JOB_UPDATE, RecommendationQueue
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'  # Change this to a secure secret key
+app.config['DB_POOL_SIZE'] = 8  # Pooled SQLite connections per process
 
 # Initialize Flask-Login
 login_manager = LoginManager()
@@ -20,28 +29,108 @@ login_manager.login_view = 'login'
 # Database helper functions
 DB_PATH = r"D:\Programming\What To Watch\wtwData\movies.db"
 
-# Initialize the recommender
-recommender = MovieRecommender(DB_PATH)
+# Read-only catalog snapshot, loaded once per process (see start_app) and shared
+catalog = CatalogStore(DB_PATH)
 
+# Pre-configured connections, reused across requests. Read-only endpoints
+# use the read pool so they never wait on writers (the database runs in WAL mode)
+db_pool = ConnectionPool(DB_PATH, size=app.config['DB_POOL_SIZE'], role='write')
+read_pool = ConnectionPool(DB_PATH, size=app.config['DB_POOL_SIZE'], role='read')
+
+
+def _request_connection(pool, key):
+    if not has_app_context():
+        return pool.acquire()
+    if key not in g:
+        conn = pool.acquire()
+        conn.pinned = True
+        setattr(g, key, conn)
+    return g.get(key)
 
 def get_db_connection():
+    """Pooled connection; inside a request the same one is reused until teardown"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
-        return conn
+        return _request_connection(db_pool, 'db_conn')
     except Error as e:
         print(e)
         return None
 
-def query_db(query, args=(), one=False):
-    conn = get_db_connection()
+def get_read_connection():
+    """Pooled read-only connection, reused like get_db_connection"""
+    try:
+        return _request_connection(read_pool, 'db_read_conn')
+    except Error as e:
+        print(e)
+        return None
+
+@app.teardown_appcontext
+def release_db_connection(exception):
+    for key in ('db_conn', 'db_read_conn'):
+        conn = g.pop(key, None)
+        if conn is not None:
+            conn.pinned = False
+            conn.close()
+
+# Autocomplete prefix and fuzzy title indexes over the catalog snapshot, built
+# in the background from startup on and again after a reload. Requests use SQL
+# until the first build is ready
+suggestion_index = SnapshotIndexCache(TitlePrefixIndex)
+fuzzy_index = SnapshotIndexCache(TrigramIndex)
+
+# Initialize the recommender, sharing the request's pooled connection
+recommender = MovieRecommender(DB_PATH, catalog=catalog, connect=get_db_connection)
+
+# Full refreshes run in worker processes, off the request path
+refresh_queue = RecommendationQueue(DB_PATH, processes=2, connect=get_db_connection)
+
+_started = False
+_start_lock = threading.Lock()
+
+def start_app():
+    """Once per web process: update the schema, load the catalog and start the title index builds.
+
+    Not done at import: the refresh workers are spawned processes, which
+    re-import the main module (app.py itself under "python app.py").
+    """
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+
+        # Create any missing tables, columns and indexes
+        try:
+            schema_conn = connect(DB_PATH, role='write')
+            try:
+                ensure_schema(schema_conn)
+            finally:
+                schema_conn.close()
+        except Error as e:
+            print(e)
+
+        try:
+            snapshot = catalog.load()
+            suggestion_index.start(snapshot)
+            fuzzy_index.start(snapshot)
+        except Error as e:
+            # Retried lazily on first use
+            print(e)
+
+@app.before_request
+def ensure_started():
+    # WSGI servers import the app without running __main__
+    start_app()
+
+def query_db(query, args=(), one=False, read_only=False):
+    conn = get_read_connection() if read_only else get_db_connection()
     if not conn:
         return None
     cur = conn.cursor()
     try:
         cur.execute(query, args)
         rv = cur.fetchall()
-        conn.commit()
+        if not read_only:
+            conn.commit()
         return (rv[0] if rv else None) if one else rv
     except Error as e:
         print(e)
@@ -50,6 +139,24 @@ def query_db(query, args=(), one=False):
         cur.close()
         conn.close()
 
+def touch_recommender_inputs(conn, user_id):
+    """Record that the user's recommender inputs changed, deletes included.
+
+    Runs in the caller's transaction; precompute_recommendations.py --since
+    selects users by this timestamp.
+    """
+    conn.execute('UPDATE users SET inputs_changed_at = CURRENT_TIMESTAMP WHERE id = ?', [user_id])
+
+def update_user_recommendations(user_id):
+    """Keep stored recommendations fresh after an event that changes recommender inputs.
+
+    The incremental update runs in the refresh workers, off the request path.
+    """
+    try:
+        refresh_queue.submit(user_id, JOB_UPDATE)
+    except Exception as e:
+        print(f"Recommendation update error: {str(e)}")
+
 # User class for Flask-Login
 class User(UserMixin):
     def __init__(self, id, username):
@@ -58,7 +165,7 @@ class User(UserMixin):
 
 @login_manager.user_loader
 def load_user(user_id):
-    user = query_db('SELECT * FROM users WHERE id = ?', [user_id], one=True)
+    user = query_db('SELECT * FROM users WHERE id = ?', [user_id], one=True, read_only=True)
     if not user:
         return None
     return User(user['id'], user['username'])
@@ -158,38 +265,40 @@ def search():
 def api_suggestions():
     query = request.args.get('query', '').strip()
     search_type = request.args.get('type', 'movie')
+    fuzzy = request.args.get('mode') == 'fuzzy'
     
     if not query:
         return jsonify([])
 
-    conn = get_db_connection()
-    try:
-        # Only handle movie/TV show search
-        results = conn.execute('''
-            SELECT title, year 
-            FROM media 
-            WHERE type = ? AND LOWER(title) LIKE LOWER(?) 
-            ORDER BY 
-                CASE 
-                    WHEN LOWER(title) = LOWER(?) THEN 1
-                    WHEN LOWER(title) LIKE LOWER(?) THEN 2
-                    ELSE 3
-                END,
-                title
-            LIMIT 10
-        ''', (search_type, f'{query}%', query, f'{query}%')).fetchall()
-        
-        suggestions = [
-            {
-                'label': f"{row['title']} ({row['year']})",
-                'value': row['title']
-            }
-            for row in results
+    # Only handle movie/TV show search, served from the in-memory prefix index
+    snapshot = catalog.get()
+    index = suggestion_index.get(snapshot)
+    titles = []
+    if not fuzzy and index is not None:
+        # Positions belong to the index's snapshot, which lags a reload until rebuilt
+        titles = [
+            (media['title'], media['year'])
+            for media in map(index.snapshot.media_dict, index.suggest(query, search_type, limit=10))
         ]
-        
-        return jsonify(suggestions)
-    finally:
-        conn.close()
+    elif not fuzzy:
+        # Still building; the search_key index answers prefix lookups meanwhile
+        conn = get_read_connection()
+        try:
+            titles = [(row['title'], row['year']) for row in suggest_titles(conn, query, search_type, limit=10)]
+        finally:
+            conn.close()
+    if not titles:
+        # Typo-tolerant fallback, e.g. "godfathr", once the trigram index is built
+        index = fuzzy_index.get(snapshot)
+        if index is not None:
+            titles = [
+                (media['title'], media['year'])
+                for media in map(index.snapshot.media_dict, index.search(query, search_type, limit=10))
+            ]
+
+    suggestions = [{'label': f"{title} ({year})", 'value': title} for title, year in titles]
+
+    return jsonify(suggestions)
 
 @app.route("/api/search_query")
 @login_required
@@ -197,69 +306,22 @@ def api_search():
     query = request.args.get('query', '').strip()
     search_type = request.args.get('type', 'movie')
     sort_by = request.args.get('sort', 'relevance')
+    fuzzy = request.args.get('mode') == 'fuzzy'
     
     if not query:
         return jsonify([])
 
-    conn = get_db_connection()
+    conn = get_read_connection()
     try:
-        # Updated query to include favorite status
-        query_sql = '''
-            SELECT 
-                m.*,
-                r.average_rating,
-                r.num_votes,
-                GROUP_CONCAT(DISTINCT g.name) as genres,
-                CASE WHEN f.id IS NOT NULL THEN 1 ELSE 0 END as is_favorite,
-                CASE WHEN w.id IS NOT NULL THEN 1 ELSE 0 END as in_watchlist
-            FROM media m
-            LEFT JOIN ratings r ON m.id = r.media_id
-            LEFT JOIN media_genres mg ON m.id = mg.media_id
-            LEFT JOIN genres g ON mg.genre_id = g.id
-            LEFT JOIN favorites f ON m.id = f.item_id 
-                AND f.user_id = ? 
-                AND f.item_type = 'media'
-            LEFT JOIN watchlist w ON m.id = w.media_id 
-                AND w.user_id = ?
-            WHERE m.type = ? AND (
-                LOWER(m.title) LIKE LOWER(?) OR
-                LOWER(m.plot) LIKE LOWER(?) OR
-                EXISTS (
-                    SELECT 1 FROM media_genres mg2
-                    JOIN genres g2 ON mg2.genre_id = g2.id
-                    WHERE mg2.media_id = m.id AND LOWER(g2.name) LIKE LOWER(?)
-                )
+        # Full-text search, including favorite/watchlist status
+        results = [] if fuzzy else search_media(conn, current_user.id, query, search_type, sort_by)
+        if not results:
+            # Typo-tolerant fallback over titles, once the trigram index is built
+            index = fuzzy_index.get(catalog.get())
+            positions = index.search(query, search_type, limit=20) if index is not None else []
+            results = search_media_by_ids(
+                conn, current_user.id, [int(index.snapshot.media_ids[p]) for p in positions]
             )
-            GROUP BY m.id
-        '''
-        
-        # Base parameters including user_id for favorites and watchlist
-        params = [current_user.id, current_user.id, search_type, f'%{query}%', f'%{query}%', f'%{query}%']
-
-        # Add sorting
-        if sort_by == 'rating':
-            query_sql += ' ORDER BY r.average_rating DESC NULLS LAST, m.title'
-        elif sort_by == 'year':
-            query_sql += ' ORDER BY m.year DESC, m.title'
-        elif sort_by == 'title':
-            query_sql += ' ORDER BY m.title'
-        else:  # relevance
-            query_sql += '''
-                ORDER BY 
-                    CASE 
-                        WHEN LOWER(m.title) = LOWER(?) THEN 1
-                        WHEN LOWER(m.title) LIKE LOWER(?) THEN 2
-                        WHEN LOWER(m.plot) LIKE LOWER(?) THEN 3
-                        ELSE 4
-                    END,
-                    r.average_rating DESC NULLS LAST,
-                    m.title
-            '''
-            params.extend([query, f'{query}%', f'%{query}%'])
-
-        query_sql += ' LIMIT 20'
-        
-        results = conn.execute(query_sql, params).fetchall()
         
         processed_results = []
         for row in results:
@@ -289,7 +351,7 @@ def api_search():
 @app.route('/api/check-favorite/<int:media_id>')
 @login_required
 def check_favorite(media_id):
-    conn = get_db_connection()
+    conn = get_read_connection()
     try:
         result = conn.execute('''
             SELECT 1 FROM favorites 
@@ -340,8 +402,12 @@ def manage_favorites():
                     DELETE FROM favorites
                     WHERE user_id = ? AND item_id = ? AND item_type = ?
                 ''', [current_user.id, item_id, item_type])
-            
+            if item_type == 'media':
+                touch_recommender_inputs(conn, current_user.id)
+
             conn.commit()
+            if item_type == 'media':
+                update_user_recommendations(current_user.id)
             return jsonify({'success': True})
         finally:
             conn.close()
@@ -401,8 +467,10 @@ def add_to_history():
                 (user_id, media_id, watch_date)
                 VALUES (?, ?, CURRENT_TIMESTAMP)
             ''', [current_user.id, media_id])
-            
+            touch_recommender_inputs(conn, current_user.id)
+
             conn.commit()
+            update_user_recommendations(current_user.id)
             return jsonify({'success': True})
         finally:
             conn.close()
@@ -450,7 +518,8 @@ def preferences():
                 request.form.get('include_ratings') == 'on', 
                 request.form.get('include_favorites') == 'on'
             ])
-            
+            touch_recommender_inputs(conn, current_user.id)
+
             conn.commit()
             flash('Preferences saved successfully!', 'success')
             
@@ -522,8 +591,10 @@ def save_genre_preference():
                     DELETE FROM user_preferences
                     WHERE user_id = ? AND genre_id = ?
                 ''', [current_user.id, genre_id])
-            
+            touch_recommender_inputs(conn, current_user.id)
+
             conn.commit()
+            update_user_recommendations(current_user.id)
             return jsonify({'success': True})
         except Exception as e:
             conn.rollback()
@@ -553,7 +624,8 @@ def save_settings():
                 (user_id, min_rating, year_from, year_to, include_watch_history, include_ratings, include_favorites, updated_at)
                 VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
             ''', [current_user.id, min_rating, year_from, year_to, include_watch_history, include_ratings, include_favorites])
-            
+            touch_recommender_inputs(conn, current_user.id)
+
             conn.commit()
             return jsonify({'success': True})
         finally:
@@ -607,8 +679,10 @@ def update_rating():
                     SET rating = ?
                     WHERE user_id = ? AND media_id = ?
                 ''', [rating, current_user.id, media_id])
-            
+            touch_recommender_inputs(conn, current_user.id)
+
             conn.commit()
+            update_user_recommendations(current_user.id)
             return jsonify({
                 'success': True,
                 'message': 'Rating updated successfully'
@@ -648,7 +722,7 @@ def profile():
             AND f.item_type = 'media'
         WHERE wh.user_id = ?
         ORDER BY wh.watch_date DESC
-    """, [current_user.id])
+    """, [current_user.id], read_only=True)
 
     # Get user's watchlist
     watchlist = query_db("""
@@ -668,7 +742,7 @@ def profile():
             AND f.item_type = 'media'
         WHERE w.user_id = ?
         ORDER BY w.priority ASC, w.date_added DESC
-    """, [current_user.id])
+    """, [current_user.id], read_only=True)
 
     return render_template("profile.html", 
                          watch_history=watch_history, 
@@ -682,8 +756,10 @@ def recommendations():
     refresh = request.args.get('refresh', 'false').lower() == 'true'
     
     if refresh:
-        recommender.refresh_recommendations(current_user.id)
+        refresh_queue.submit(current_user.id)
+    refresh_pending = refresh_queue.is_pending(current_user.id)
     
+    # Serve the current stored list right away; a pending refresh replaces it later
     recommendations = recommender.get_stored_recommendations(current_user.id)
     
     # Convert Row objects to dictionaries and ensure numeric values are properly handled
@@ -709,7 +785,8 @@ def recommendations():
         return jsonify({
             'items': current_page_items,
             'total_pages': total_pages,
-            'current_page': page
+            'current_page': page,
+            'refresh_pending': refresh_pending
         })
     
     return render_template(
@@ -721,4 +798,5 @@ def recommendations():
     
 if __name__ == '__main__':
     print("Starting Flask application...")
+    start_app()
     app.run(debug=True, host='127.0.0.1')
\ No newline at end of file
@@ -0,0 +1,243 @@
+import argparse
+import contextlib
+import gzip
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Allow running as a script from the benchmarks directory
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+sys.path.append(str(ROOT / 'helpers'))
+from imdb_importer import IMPORT_CHUNK_SIZE, SOURCES, IMDbDataImporter, run_import
+from schema import CATALOG_TABLES
+
+# Rows of each dataset per title.basics row, roughly the proportions of the real dumps
+SCALE = {'titles': 1.0, 'people': 1.0, 'ratings': 0.6, 'principals': 4.0}
+
+# Import step -> dataset it reads, for rows/sec
+STEP_DATASETS = {'titles': 'titles', 'people': 'people', 'ratings': 'ratings', 'media_people': 'principals'}
+
+TITLE_TYPES = ['movie', 'movie', 'tvMovie', 'tvSeries', 'short', 'tvEpisode', 'video']
+GENRES = ['Action', 'Adventure', 'Animation', 'Comedy', 'Crime', 'Documentary', 'Drama', 'Family',
+          'Fantasy', 'Horror', 'Mystery', 'Romance', 'Sci-Fi', 'Thriller', 'War', 'Western']
+WORDS = ['the', 'night', 'love', 'war', 'star', 'last', 'city', 'dark', 'Amélie', 'café', 'über',
+         'return', 'of', 'king', 'blue', 'man', 'house', 'río', 'dream', 'summer']
+CATEGORIES = ['actor', 'actress', 'director', 'writer', 'producer', 'composer', 'self']
+
+# Written in batches so generating millions of rows stays reasonably fast
+WRITE_BATCH = 10_000
+
+
+def write_tsv(path, header, rows):
+    """Write rows to a .tsv.gz file; returns the number of data rows"""
+    count = 0
+    with gzip.open(path, 'wt', encoding='utf-8', compresslevel=1) as f:
+        f.write('\t'.join(header) + '\n')
+        batch = []
+        for row in rows:
+            batch.append('\t'.join(row))
+            if len(batch) == WRITE_BATCH:
+                f.write('\n'.join(batch) + '\n')
+                count += len(batch)
+                batch = []
+        if batch:
+            f.write('\n'.join(batch) + '\n')
+            count += len(batch)
+    return count
+
+
+def generate_fixtures(fixture_dir, titles, seed=0):
+    """Write synthetic IMDb dumps with `titles` title.basics rows to fixture_dir.
+
+    The files have the real column layout, '\\N' nulls, accented titles and
+    title types/categories the importer filters out. Generation is
+    deterministic for a given (titles, seed), and skipped when fixture_dir
+    already holds a complete set. Returns {dataset: rows}.
+    """
+    fixture_dir = Path(fixture_dir)
+    manifest_path = fixture_dir / 'fixtures.json'
+    if manifest_path.exists():
+        manifest = json.loads(manifest_path.read_text())
+        if manifest['titles'] == titles and manifest['seed'] == seed:
+            return manifest['rows']
+    fixture_dir.mkdir(parents=True, exist_ok=True)
+
+    rng = random.Random(seed)
+    counts = {name: max(1, int(titles * ratio)) for name, ratio in SCALE.items()}
+    years = ['\\N'] + [str(year) for year in range(1920, 2025)]
+
+    def title_rows():
+        for i in range(1, counts['titles'] + 1):
+            title = ' '.join(rng.choices(WORDS, k=rng.randint(1, 4))).capitalize()
+            genres = '\\N' if rng.random() < 0.05 else ','.join(rng.sample(GENRES, rng.randint(1, 3)))
+            yield [f'tt{i:08d}', rng.choice(TITLE_TYPES), title, title, '0', rng.choice(years), '\\N',
+                   str(rng.randint(20, 200)) if rng.random() < 0.8 else '\\N', genres]
+
+    def people_rows():
+        for i in range(1, counts['people'] + 1):
+            name = f"{rng.choice(WORDS).capitalize()} {rng.choice(WORDS).capitalize()}"
+            birth_year = str(rng.randint(1900, 2005)) if rng.random() < 0.4 else '\\N'
+            yield [f'nm{i:08d}', name, birth_year, '\\N', ','.join(rng.sample(CATEGORIES, 2)), '\\N']
+
+    def rating_rows():
+        # Ratings cover a sorted random subset of the titles, as in the real dump
+        for i in sorted(rng.sample(range(1, counts['titles'] + 1), counts['ratings'])):
+            yield [f'tt{i:08d}', f'{rng.uniform(1, 10):.1f}', str(int(rng.paretovariate(1.2) * 5))]
+
+    def principal_rows():
+        per_title = counts['principals'] / counts['titles']
+        written = 0
+        for i in range(1, counts['titles'] + 1):
+            for ordering in range(1, int(per_title * i) - written + 1):
+                category = rng.choice(CATEGORIES)
+                characters = f'["{rng.choice(WORDS).capitalize()}"]' if category in ('actor', 'actress') else '\\N'
+                yield [f'tt{i:08d}', str(ordering), f'nm{rng.randint(1, counts["people"]):08d}',
+                       category, '\\N', characters]
+                written += 1
+
+    generators = {
+        'titles': (['tconst', 'titleType', 'primaryTitle', 'originalTitle', 'isAdult',
+                    'startYear', 'endYear', 'runtimeMinutes', 'genres'], title_rows),
+        'people': (['nconst', 'primaryName', 'birthYear', 'deathYear',
+                    'primaryProfession', 'knownForTitles'], people_rows),
+        'ratings': (['tconst', 'averageRating', 'numVotes'], rating_rows),
+        'principals': (['tconst', 'ordering', 'nconst', 'category', 'job', 'characters'], principal_rows),
+    }
+    rows = {}
+    for name, (header, make_rows) in generators.items():
+        rows[name] = write_tsv(fixture_dir / SOURCES[name][0], header, make_rows())
+
+    manifest_path.write_text(json.dumps({'titles': titles, 'seed': seed, 'rows': rows}, indent=2))
+    return rows
+
+
+def peak_rss_mb(children=False):
+    """Peak resident set size of this process, or of its largest finished child, in MB"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run_once(fixture_dir, db_path, full, parallel, chunksize, results):
+    """Benchmark process: run one import and put its measurements on `results`.
+
+    Runs in a fresh process so peak RSS covers the import alone.
+    """
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        importer = IMDbDataImporter(chunksize, data_dir=fixture_dir, db_path=db_path,
+                                    log_dir=Path(db_path).parent / 'log')
+        start = time.perf_counter()
+        run_import(importer, full=full, parallel=parallel)
+        total = time.perf_counter() - start
+
+    conn = sqlite3.connect(db_path)
+    try:
+        tables = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in CATALOG_TABLES}
+    finally:
+        conn.close()
+
+    results.put({
+        'seconds': round(total, 3),
+        'steps': {step: round(seconds, 3) for step, seconds in importer.timings.items()},
+        'tables': tables,
+        'peak_rss_mb': peak_rss_mb(),
+        'peak_rss_parsers_mb': peak_rss_mb(children=True),
+    })
+
+
+def benchmark(fixture_dir, db_path, mode, parallel, chunksize, rows):
+    """Run one import in a child process and add rows/sec to its measurements"""
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(
+        target=run_once,
+        args=(str(fixture_dir), str(db_path), mode == 'full', parallel, chunksize, results)
+    )
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise RuntimeError(f"{mode} import failed (exit code {process.exitcode})")
+    run = results.get()
+
+    total_rows = sum(rows.values())
+    run['mode'] = mode
+    run['rows_per_sec'] = round(total_rows / run['seconds'])
+    run['step_rows_per_sec'] = {
+        step: round(rows[dataset] / run['steps'][step])
+        for step, dataset in STEP_DATASETS.items()
+        if run['steps'].get(step)
+    }
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark IMDbDataImporter on synthetic IMDb datasets and report JSON"
+    )
+    parser.add_argument('--titles', type=int, default=10_000,
+                        help="title.basics rows; the other datasets scale with it (default: 10000)")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for the synthetic data")
+    parser.add_argument('--fixtures', help="Directory to generate or reuse fixtures in (default: a temp dir)")
+    parser.add_argument('--runs', default='full,delta',
+                        help="Comma-separated imports to run in order on one database: "
+                             "full (rebuild) or delta (re-import onto the previous run's catalog)")
+    parser.add_argument('--mode', choices=['auto', 'parallel', 'sequential'], default='auto',
+                        help="Parse in worker processes or in the writer (default: as the importer decides)")
+    parser.add_argument('--chunksize', type=int, default=IMPORT_CHUNK_SIZE,
+                        help=f"Rows per DataFrame chunk (default: {IMPORT_CHUNK_SIZE})")
+    parser.add_argument('--output', help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    runs = args.runs.split(',')
+    if set(runs) - {'full', 'delta'}:
+        parser.error("--runs takes 'full' and 'delta'")
+    parallel = {'auto': None, 'parallel': True, 'sequential': False}[args.mode]
+
+    with tempfile.TemporaryDirectory(prefix='wtw_import_bench_') as tmp:
+        fixture_dir = Path(args.fixtures or Path(tmp) / 'data')
+        start = time.perf_counter()
+        rows = generate_fixtures(fixture_dir, args.titles, args.seed)
+        generate_seconds = time.perf_counter() - start
+        print(f"Fixtures ready in {generate_seconds:.1f}s: {rows}", file=sys.stderr)
+
+        db_path = Path(tmp) / 'movies.db'
+        results = []
+        for mode in runs:
+            print(f"Running {mode} import...", file=sys.stderr)
+            results.append(benchmark(fixture_dir, db_path, mode, parallel, args.chunksize, rows))
+
+    report = {
+        'config': {
+            'titles': args.titles,
+            'seed': args.seed,
+            'mode': args.mode,
+            'chunksize': args.chunksize,
+            'cpu_count': os.cpu_count(),
+            'python': sys.version.split()[0],
+            'sqlite': sqlite3.sqlite_version,
+        },
+        'fixture_rows': rows,
+        'runs': results,
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        Path(args.output).write_text(output + '\n')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Allow running as a script from the benchmarks directory
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from catalog import export_catalog
+from db import connect
+from recommendations import MovieRecommender
+from schema import ensure_schema
+from workers import refresh_users
+
+GENRES = ['Action', 'Adventure', 'Animation', 'Biography', 'Comedy', 'Crime', 'Documentary',
+          'Drama', 'Family', 'Fantasy', 'History', 'Horror', 'Music', 'Musical', 'Mystery',
+          'Romance', 'Sci-Fi', 'Sport', 'Thriller', 'War', 'Western', 'Reality-TV', 'Talk-Show']
+
+# Synthetic user profiles are drawn from these, so every run covers light and heavy users
+PREFERENCE_COUNTS = [1, 3, 6, 12]
+HISTORY_SIZES = [0, 10, 100, 1000]
+FAVORITE_COUNTS = [0, 5, 50]
+
+
+def build_database(db_path, titles, users, seed=0):
+    """Create a catalog of `titles` synthetic titles and `users` users with varied profiles.
+
+    Users cycle through every combination of PREFERENCE_COUNTS,
+    HISTORY_SIZES and FAVORITE_COUNTS; about a third get custom settings
+    (rating/year filters, disabled history or favorites terms).
+    """
+    rng = random.Random(seed)
+    conn = connect(db_path, role='write')
+    try:
+        ensure_schema(conn)
+        with conn:
+            conn.executemany('INSERT INTO genres (id, name) VALUES (?, ?)', list(enumerate(GENRES, 1)))
+            conn.executemany('''
+                INSERT INTO media (id, imdb_id, title, original_title, type, year, runtime_minutes, search_key)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                (i, f'tt{i:08d}', f'Title {i}', f'Title {i}', rng.choice(['movie', 'movie', 'tv']),
+                 rng.choice([None] + list(range(1920, 2025))), rng.randint(20, 200), f'title {i}')
+                for i in range(1, titles + 1)
+            ))
+            conn.executemany('INSERT INTO media_genres (media_id, genre_id) VALUES (?, ?)', (
+                (i, genre_id)
+                for i in range(1, titles + 1)
+                # Skewed towards the first genres, like Drama/Comedy in the real data
+                for genre_id in set(min(int(rng.expovariate(0.15)), len(GENRES) - 1) + 1
+                                    for _ in range(rng.randint(0, 3)))
+            ))
+            conn.executemany('INSERT INTO ratings (media_id, average_rating, num_votes) VALUES (?, ?, ?)', (
+                (i, round(rng.uniform(1, 10), 1), int(rng.paretovariate(1.1) * 5))
+                for i in range(1, titles + 1) if rng.random() < 0.7
+            ))
+
+            profiles = [
+                (preferences, history, favorites)
+                for preferences in PREFERENCE_COUNTS
+                for history in HISTORY_SIZES
+                for favorites in FAVORITE_COUNTS
+            ]
+            for user_id in range(1, users + 1):
+                preferences, history, favorites = profiles[(user_id - 1) % len(profiles)]
+                conn.execute('INSERT INTO users (id, username, hash) VALUES (?, ?, ?)',
+                             (user_id, f'user{user_id}', '-'))
+                conn.executemany('INSERT INTO user_preferences (user_id, genre_id, weight) VALUES (?, ?, ?)', [
+                    (user_id, genre_id, round(rng.uniform(0.5, 2.0), 2))
+                    for genre_id in rng.sample(range(1, len(GENRES) + 1), preferences)
+                ])
+                conn.executemany('INSERT INTO watch_history (user_id, media_id, rating) VALUES (?, ?, ?)', [
+                    (user_id, media_id, rng.choice([None, rng.randint(1, 10)]))
+                    for media_id in rng.sample(range(1, titles + 1), min(history, titles))
+                ])
+                conn.executemany('INSERT INTO favorites (user_id, item_id, item_type) VALUES (?, ?, ?)', [
+                    (user_id, media_id, 'media')
+                    for media_id in rng.sample(range(1, titles + 1), min(favorites, titles))
+                ])
+                if user_id % 3 == 0:
+                    year_from = rng.choice([1900, 1970, 1990, 2010])
+                    conn.execute('''
+                        INSERT INTO user_settings (user_id, min_rating, year_from, year_to,
+                            include_watch_history, include_ratings, include_favorites)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ''', (user_id, rng.choice([0.0, 5.0, 6.0, 7.5]), year_from, 2024,
+                          rng.random() < 0.7, True, rng.random() < 0.7))
+    finally:
+        conn.close()
+    export_catalog(db_path)
+
+
+class QueryCounter:
+    """Connection factory for MovieRecommender that counts the SQL statements run.
+
+    executemany() counts once per row, as SQLite executes the statement per row.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.count = 0
+
+    def _trace(self, statement):
+        self.count += 1
+
+    def __call__(self):
+        conn = connect(self.db_path, role='write')
+        conn.row_factory = sqlite3.Row
+        conn.set_trace_callback(self._trace)
+        return conn
+
+
+def summarize(latencies):
+    """Latency percentiles in milliseconds"""
+    ms = np.asarray(latencies) * 1000
+    return {
+        'mean': round(float(ms.mean()), 3),
+        'p50': round(float(np.percentile(ms, 50)), 3),
+        'p90': round(float(np.percentile(ms, 90)), 3),
+        'p99': round(float(np.percentile(ms, 99)), 3),
+        'max': round(float(ms.max()), 3),
+    }
+
+
+def bench_single(db_path, user_ids, limit, incremental=False):
+    """Refresh each user in turn; returns (measurements, {user_id: top-K})"""
+    counter = QueryCounter(db_path)
+    recommender = MovieRecommender(db_path, connect=counter)
+    recommender.catalog.load()
+    refresh = recommender.update_recommendations if incremental else recommender.get_recommendations
+
+    latencies, queries, top = [], [], {}
+    start = time.perf_counter()
+    for user_id in user_ids:
+        counter.count = 0
+        call_start = time.perf_counter()
+        recommendations = refresh(user_id, limit)
+        latencies.append(time.perf_counter() - call_start)
+        queries.append(counter.count)
+        top[str(user_id)] = [[rec['movie']['id'], rec['score']] for rec in recommendations]
+    elapsed = time.perf_counter() - start
+
+    return {
+        'users': len(user_ids),
+        'latency_ms': summarize(latencies),
+        'queries_per_user': {'mean': round(float(np.mean(queries)), 2), 'max': int(max(queries))},
+        'users_per_sec': round(len(user_ids) / elapsed, 1),
+    }, top
+
+
+def bench_batch(db_path, user_ids, processes):
+    """Refresh every user through the precompute process pool"""
+    start = time.perf_counter()
+    done = sum(1 for _, error in refresh_users(str(db_path), user_ids, processes) if error is None)
+    elapsed = time.perf_counter() - start
+    return {
+        'users': done,
+        'processes': processes or os.cpu_count(),
+        'seconds': round(elapsed, 3),
+        'users_per_sec': round(done / elapsed, 1),
+    }
+
+
+def compare_snapshots(expected, actual):
+    """User ids whose top-K ids, order or scores differ from the snapshot"""
+    return sorted((user_id for user_id in expected if expected[user_id] != actual.get(user_id)), key=int)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark MovieRecommender on a synthetic catalog and users and report JSON"
+    )
+    parser.add_argument('--titles', type=int, default=100_000, help="Titles in the catalog (default: 100000)")
+    parser.add_argument('--users', type=int, default=480, help="Users to refresh (default: 480)")
+    parser.add_argument('--limit', type=int, default=50, help="Recommendations per user (default: 50)")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for the synthetic data")
+    parser.add_argument('--processes', type=int, default=None,
+                        help="Worker processes for the batch refresh (default: CPU count)")
+    parser.add_argument('--snapshot', help="Write every user's top-K (media id, score) to this JSON file")
+    parser.add_argument('--compare', help="Check the top-K against a snapshot written by --snapshot; "
+                                          "exits with status 1 on any difference")
+    parser.add_argument('--output', help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='wtw_recommender_bench_', ignore_cleanup_errors=True) as tmp:
+        db_path = Path(tmp) / 'movies.db'
+        start = time.perf_counter()
+        build_database(db_path, args.titles, args.users, args.seed)
+        print(f"Synthetic database ready in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+        user_ids = list(range(1, args.users + 1))
+        print("Running single-user refreshes...", file=sys.stderr)
+        full, top = bench_single(db_path, user_ids, args.limit)
+        print("Running incremental updates...", file=sys.stderr)
+        incremental, _ = bench_single(db_path, user_ids, args.limit, incremental=True)
+        print("Running batch refresh...", file=sys.stderr)
+        batch = bench_batch(db_path, user_ids, args.processes)
+
+    report = {
+        'config': {
+            'titles': args.titles,
+            'users': args.users,
+            'limit': args.limit,
+            'seed': args.seed,
+            'cpu_count': os.cpu_count(),
+            'python': sys.version.split()[0],
+            'numpy': np.__version__,
+        },
+        'get_recommendations': full,
+        'update_recommendations': incremental,
+        'batch_refresh': batch,
+    }
+
+    mismatched = []
+    if args.compare:
+        expected = json.loads(Path(args.compare).read_text())
+        if expected['config'] != {'titles': args.titles, 'users': args.users, 'limit': args.limit, 'seed': args.seed}:
+            parser.error("--compare snapshot was taken with different --titles/--users/--limit/--seed")
+        mismatched = compare_snapshots(expected['top'], top)
+        report['snapshot_mismatches'] = mismatched
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        Path(args.output).write_text(output + '\n')
+    if args.snapshot:
+        snapshot = {
+            'config': {'titles': args.titles, 'users': args.users, 'limit': args.limit, 'seed': args.seed},
+            'top': top,
+        }
+        Path(args.snapshot).write_text(json.dumps(snapshot) + '\n')
+    if mismatched:
+        print(f"Top-K differs from {args.compare} for {len(mismatched)} users: {mismatched[:20]}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
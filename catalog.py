@@ -0,0 +1,380 @@
+import mmap
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+from db import connect
+from scoring import GenreBits, rating_terms as compute_rating_terms
+
+TYPE_CODES = {'movie': 0, 'tv': 1}
+TYPE_NAMES = {code: name for name, code in TYPE_CODES.items()}
+TYPE_UNKNOWN = 255
+YEAR_MISSING = np.iinfo(np.int16).min  # never inside a BETWEEN year range
+RUNTIME_MISSING = -1
+RUNTIME_MAX = np.iinfo(np.int16).max
+
+# Seconds between checks for a newly exported catalog in CatalogStore.get()
+CATALOG_CHECK_SECONDS = 1.0
+
+
+# On-disk catalog format: a 64-byte header followed by fixed-order arrays,
+# each starting on an 8-byte boundary (see CatalogSnapshot.save)
+CATALOG_MAGIC = b'WTWCAT\x00\x01'
+CATALOG_VERSION = 1
+CATALOG_HEADER = struct.Struct('<8sIIQQ')  # magic, version, genre count, media count, title bytes
+CATALOG_HEADER_SIZE = 64
+
+
+def catalog_file_path(db_path):
+    """Base path of the binary catalogs exported next to the database by the importer.
+
+    Each export is written as a new generation, <base>.<n>, instead of
+    replacing the file running processes have mapped (which Windows refuses).
+    """
+    return f"{db_path}.catalog"
+
+
+def catalog_generations(base_path):
+    """{generation: path} of the catalog files under `base_path`"""
+    directory, prefix = os.path.split(os.path.abspath(base_path))
+    generations = {}
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return generations
+    for name in names:
+        suffix = name[len(prefix) + 1:]
+        if name.startswith(prefix + '.') and suffix.isdigit():
+            generations[int(suffix)] = os.path.join(directory, name)
+    return generations
+
+
+def latest_catalog_file(base_path):
+    """Path of the newest catalog generation, or None if none was exported"""
+    generations = catalog_generations(base_path)
+    return generations[max(generations)] if generations else None
+
+
+def remove_old_catalogs(base_path, keep):
+    """Delete catalog generations other than `keep` that nothing has mapped.
+
+    Windows refuses to delete a mapped file, so those are left for a later
+    call; elsewhere the mappings outlive the deleted name.
+    """
+    # The bare base path is the single file written before generations
+    keep = keep and os.path.abspath(keep)
+    stale = [path for path in catalog_generations(base_path).values() if path != keep]
+    if os.path.exists(base_path):
+        stale.append(base_path)
+    for path in stale:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _section_layout(genre_count, count, title_bytes):
+    """(name, dtype, length) for every array in file order"""
+    return [
+        ('genre_ids', np.int64, genre_count),
+        ('media_ids', np.int64, count),
+        ('ratings', np.float64, count),
+        ('rating_terms', np.float64, count),
+        ('votes', np.int64, count),
+        ('genre_masks', np.uint64, count),
+        ('title_offsets', np.int64, count + 1),
+        ('years', np.int16, count),
+        ('runtimes', np.int16, count),
+        ('types', np.uint8, count),
+        ('titles', np.uint8, title_bytes),
+    ]
+
+
+def _aligned(offset):
+    return (offset + 7) & ~7
+
+
+class CatalogSnapshot:
+    """Read-only, array-backed view of the media catalog.
+
+    All per-title arrays are aligned and ordered by ascending media id:
+    media_ids, years, runtimes, types, ratings (NaN when unrated), votes,
+    genre_masks (one bit per genre, see GenreBits) and rating_terms. Titles
+    are one UTF-8 blob indexed by title_offsets.
+
+    A snapshot is either loaded from the database or mapped zero-copy from
+    the binary file written by the importer (see from_file/save).
+    """
+
+    def __init__(self, media_ids, years, runtimes, types, ratings, votes, genre_masks,
+                 title_offsets, titles, genre_bits, rating_terms=None, source=None):
+        self.media_ids = media_ids
+        self.years = years
+        self.runtimes = runtimes
+        self.types = types
+        self.ratings = ratings
+        self.votes = votes
+        self.genre_masks = genre_masks
+        self.title_offsets = title_offsets
+        self.titles = titles
+        self.genre_bits = genre_bits
+        # The rating term does not depend on the user, so compute it once
+        self.rating_terms = rating_terms if rating_terms is not None else compute_rating_terms(ratings, votes)
+        # Keeps the backing mmap alive for file-based snapshots
+        self._source = source
+
+    def __len__(self):
+        return len(self.media_ids)
+
+    @classmethod
+    def from_db(cls, conn):
+        """Load the catalog tables into arrays"""
+        genre_bits = GenreBits(row[0] for row in conn.execute('SELECT id FROM genres'))
+
+        rows = conn.execute('''
+            SELECT m.id, m.year, m.runtime_minutes, m.type, r.average_rating, r.num_votes, m.title
+            FROM media m
+            LEFT JOIN ratings r ON m.id = r.media_id
+            GROUP BY m.id
+            ORDER BY m.id
+        ''').fetchall()
+
+        count = len(rows)
+        media_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=count)
+        years = np.fromiter(
+            (int(row[1]) if row[1] is not None else YEAR_MISSING for row in rows),
+            dtype=np.int16, count=count
+        )
+        runtimes = np.fromiter(
+            (min(int(row[2]), RUNTIME_MAX) if row[2] is not None else RUNTIME_MISSING for row in rows),
+            dtype=np.int16, count=count
+        )
+        types = np.fromiter(
+            (TYPE_CODES.get(row[3], TYPE_UNKNOWN) for row in rows),
+            dtype=np.uint8, count=count
+        )
+        ratings = np.fromiter(
+            (row[4] if row[4] is not None else np.nan for row in rows),
+            dtype=np.float64, count=count
+        )
+        votes = np.fromiter((row[5] or 0 for row in rows), dtype=np.int64, count=count)
+        encoded_titles = [(row[6] or '').encode('utf-8') for row in rows]
+        del rows
+
+        title_offsets = np.zeros(count + 1, dtype=np.int64)
+        np.cumsum([len(title) for title in encoded_titles], out=title_offsets[1:])
+        titles = np.frombuffer(b''.join(encoded_titles), dtype=np.uint8)
+        del encoded_titles
+        pairs = np.array(
+            conn.execute('SELECT media_id, genre_id FROM media_genres').fetchall(),
+            dtype=np.int64
+        ).reshape(-1, 2)
+        genre_masks = np.zeros(count, dtype=np.uint64)
+        if len(pairs):
+            bit_lookup = np.full(max(genre_bits.genre_ids, default=0) + 1, -1, dtype=np.int64)
+            for genre_id, bit in genre_bits.bit_of.items():
+                bit_lookup[genre_id] = bit
+            genre_ok = (pairs[:, 1] >= 0) & (pairs[:, 1] < len(bit_lookup))
+            pairs = pairs[genre_ok]
+            bits = bit_lookup[pairs[:, 1]]
+            positions = np.searchsorted(media_ids, pairs[:, 0])
+            known = (bits >= 0) & (positions < count)
+            known[known] &= media_ids[positions[known]] == pairs[known, 0]
+            np.bitwise_or.at(
+                genre_masks,
+                positions[known],
+                np.left_shift(np.uint64(1), bits[known].astype(np.uint64))
+            )
+
+        return cls(media_ids, years, runtimes, types, ratings, votes, genre_masks,
+                   title_offsets, titles, genre_bits)
+
+    @classmethod
+    def from_file(cls, path):
+        """Map a catalog file written by save(); arrays share the page cache"""
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, genre_count, count, title_bytes = CATALOG_HEADER.unpack_from(buffer, 0)
+        if magic != CATALOG_MAGIC or version != CATALOG_VERSION:
+            buffer.close()
+            raise ValueError(f"{path} is not a version {CATALOG_VERSION} catalog file")
+
+        arrays = {}
+        offset = CATALOG_HEADER_SIZE
+        for name, dtype, length in _section_layout(genre_count, count, title_bytes):
+            offset = _aligned(offset)
+            arrays[name] = np.frombuffer(buffer, dtype=dtype, count=length, offset=offset)
+            offset += arrays[name].nbytes
+
+        genre_bits = GenreBits(arrays.pop('genre_ids').tolist())
+        return cls(genre_bits=genre_bits, source=buffer, **arrays)
+
+    def save(self, path):
+        """Write the snapshot in the fixed binary layout; `path` appears only once complete"""
+        arrays = {
+            'genre_ids': np.asarray(self.genre_bits.genre_ids, dtype=np.int64),
+            'media_ids': self.media_ids,
+            'ratings': self.ratings,
+            'rating_terms': self.rating_terms,
+            'votes': self.votes,
+            'genre_masks': self.genre_masks,
+            'title_offsets': self.title_offsets,
+            'years': self.years,
+            'runtimes': self.runtimes,
+            'types': self.types,
+            'titles': self.titles,
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(CATALOG_HEADER.pack(
+                CATALOG_MAGIC, CATALOG_VERSION,
+                len(self.genre_bits.genre_ids), len(self.media_ids), len(self.titles)
+            ).ljust(CATALOG_HEADER_SIZE, b'\x00'))
+            offset = CATALOG_HEADER_SIZE
+            for name, dtype, length in _section_layout(
+                    len(self.genre_bits.genre_ids), len(self.media_ids), len(self.titles)):
+                padding = _aligned(offset) - offset
+                f.write(b'\x00' * padding)
+                data = np.ascontiguousarray(arrays[name], dtype=dtype)
+                assert len(data) == length, name
+                f.write(data.tobytes())
+                offset += padding + data.nbytes
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def positions(self, media_ids):
+        """Array positions of the given media ids; unknown ids are dropped"""
+        media_ids = np.fromiter(media_ids, dtype=np.int64)
+        positions = np.searchsorted(self.media_ids, media_ids)
+        in_range = positions < len(self.media_ids)
+        positions, media_ids = positions[in_range], media_ids[in_range]
+        return positions[self.media_ids[positions] == media_ids]
+
+    def genres_of(self, media_ids):
+        """Union of the genre ids of the given media"""
+        positions = self.positions(media_ids)
+        if not len(positions):
+            return set()
+        mask = np.bitwise_or.reduce(self.genre_masks[positions])
+        return set(self.genre_bits.ids(mask))
+
+    def in_year_range(self, year_from, year_to, positions=None):
+        """Boolean mask of titles (all, or those at `positions`) with a known year in [year_from, year_to]"""
+        bounds = np.iinfo(self.years.dtype)
+        year_from = min(max(int(year_from), bounds.min + 1), bounds.max)
+        year_to = min(max(int(year_to), bounds.min + 1), bounds.max)
+        years = self.years if positions is None else self.years[positions]
+        return (years >= year_from) & (years <= year_to)
+
+    def title(self, position):
+        start, end = self.title_offsets[position], self.title_offsets[position + 1]
+        return self.titles[start:end].tobytes().decode('utf-8')
+
+    def media_dict(self, position):
+        """Plain dict describing one catalog row"""
+        year = int(self.years[position])
+        rating = float(self.ratings[position])
+        return {
+            'id': int(self.media_ids[position]),
+            'year': year if year != YEAR_MISSING else None,
+            'title': self.title(position),
+            'type': TYPE_NAMES.get(int(self.types[position])),
+            'runtime_minutes': int(self.runtimes[position]) if self.runtimes[position] != RUNTIME_MISSING else None,
+            'average_rating': rating if not np.isnan(rating) else None,
+            'num_votes': int(self.votes[position]) if self.votes[position] else None
+        }
+
+
+def export_catalog(db_path, base_path=None):
+    """Build a snapshot from the database and write it as the next catalog generation.
+
+    Returns the path written; older generations are removed once unmapped.
+    """
+    conn = connect(db_path, role='read')
+    try:
+        snapshot = CatalogSnapshot.from_db(conn)
+    finally:
+        conn.close()
+    base_path = base_path or catalog_file_path(db_path)
+    generations = catalog_generations(base_path)
+    path = f"{base_path}.{max(generations, default=0) + 1}"
+    snapshot.save(path)
+    remove_old_catalogs(base_path, keep=path)
+    return path
+
+
+class CatalogStore:
+    """Process-wide holder of the current CatalogSnapshot.
+
+    The snapshot is mapped from the newest catalog file the importer has
+    exported (falling back to reading the database) and swapped atomically
+    for a new one when the importer exports a newer generation, which is
+    looked for at most every `check_interval` seconds. Readers never wait on
+    a rebuild; they keep using the previous snapshot until the new one is
+    ready.
+    """
+
+    def __init__(self, db_path, catalog_path=None, check_interval=CATALOG_CHECK_SECONDS):
+        self.db_path = db_path
+        self.catalog_path = catalog_path or catalog_file_path(db_path)
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._stamp = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _read_stamp(self):
+        return latest_catalog_file(self.catalog_path)
+
+    def _rebuild(self):
+        while True:
+            stamp = self._read_stamp()
+            if stamp is None:
+                conn = connect(self.db_path, role='read')
+                try:
+                    snapshot = CatalogSnapshot.from_db(conn)
+                finally:
+                    conn.close()
+                break
+            try:
+                snapshot = CatalogSnapshot.from_file(stamp)
+                break
+            except FileNotFoundError:
+                # Superseded and removed while we looked; take the newer one
+                continue
+        previous, self._snapshot, self._stamp = self._stamp, snapshot, stamp
+        self._checked_at = time.monotonic()
+        if previous is not None and previous != stamp:
+            # This process has let go of the old generation (once the
+            # snapshot is collected); delete what no process still maps
+            remove_old_catalogs(self.catalog_path, keep=stamp)
+        return snapshot
+
+    def load(self):
+        """(Re)build the snapshot and publish it"""
+        with self._lock:
+            return self._rebuild()
+
+    def get(self):
+        """Current snapshot, reloading it if the importer has published a new catalog"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return self.load()
+        # Listing the directory on every call would tax every keystroke and refresh
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return snapshot
+        self._checked_at = now
+        if self._read_stamp() != self._stamp and self._lock.acquire(blocking=False):
+            # If another thread is already reloading, keep serving the old snapshot
+            try:
+                if self._read_stamp() != self._stamp:
+                    return self._rebuild()
+            finally:
+                self._lock.release()
+        return self._snapshot
@@ -0,0 +1,148 @@
+import queue
+import sqlite3
+import threading
+from pathlib import Path
+
+# Pragmas applied once per connection, by role:
+#   read  - request-path reads; opened read-only so they never take write locks
+#   write - request-path writes and recommendation refreshes
+#   bulk  - the IMDb importer's long write transactions
+#   load  - the importer's private staging file; no journal or fsync, since a
+#           failed load just discards the file
+PRAGMAS = {
+    'read': [
+        ('query_only', 'ON'),
+        ('cache_size', -32000),  # KiB
+        ('mmap_size', 256 * 1024 * 1024),
+        ('temp_store', 'MEMORY'),
+        ('busy_timeout', 5000),
+    ],
+    'write': [
+        ('journal_mode', 'WAL'),
+        ('synchronous', 'NORMAL'),
+        ('cache_size', -16000),
+        ('mmap_size', 256 * 1024 * 1024),
+        ('temp_store', 'MEMORY'),
+        ('busy_timeout', 5000),
+    ],
+    'bulk': [
+        ('journal_mode', 'WAL'),
+        ('synchronous', 'NORMAL'),
+        ('cache_size', -256000),
+        ('temp_store', 'MEMORY'),
+        ('busy_timeout', 60000),
+    ],
+    'load': [
+        ('journal_mode', 'OFF'),
+        ('synchronous', 'OFF'),
+        ('locking_mode', 'EXCLUSIVE'),
+        ('foreign_keys', 'OFF'),
+        ('cache_size', -512000),
+        ('temp_store', 'MEMORY'),
+    ],
+}
+
+
+def configure_connection(conn, role='write'):
+    """Apply the pragmas for `role` to an open connection"""
+    for name, value in PRAGMAS[role]:
+        conn.execute(f'PRAGMA {name} = {value}')
+    return conn
+
+
+def connect(db_path, role='write', **kwargs):
+    """Open a connection configured for `role`; read connections are read-only"""
+    if role == 'read':
+        conn = sqlite3.connect(f'{Path(db_path).resolve().as_uri()}?mode=ro', uri=True, **kwargs)
+    else:
+        conn = sqlite3.connect(db_path, **kwargs)
+    return configure_connection(conn, role)
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() hands it back to its pool.
+
+    While `pinned` (e.g. bound to a Flask request) close() is a no-op, so
+    helpers that open and close connections can share the request's one.
+    """
+
+    pool = None
+    pinned = False
+    leased = False
+
+    def close(self):
+        if self.pinned:
+            return
+        if self.pool is not None:
+            self.pool.release(self)
+        else:
+            super().close()
+
+    def dispose(self):
+        """Really close the underlying connection"""
+        sqlite3.Connection.close(self)
+
+
+class ConnectionPool:
+    """Bounded pool of pre-configured SQLite connections.
+
+    Connections are created lazily up to `size` and configured once
+    (row_factory and the pragmas for `role`). acquire() waits up to
+    `timeout` seconds for a free connection when all of them are in use.
+    """
+
+    def __init__(self, db_path, size=8, timeout=10.0, role='write'):
+        self.db_path = db_path
+        self.size = size
+        self.role = role
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._all = []
+
+    def _connect(self):
+        conn = connect(self.db_path, self.role, factory=PooledConnection, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.pool = self
+        with self._lock:
+            self._all.append(conn)
+        return conn
+
+    def acquire(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise sqlite3.OperationalError("Timed out waiting for a database connection")
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            try:
+                conn = self._connect()
+            except Exception:
+                self._slots.release()
+                raise
+        conn.leased = True
+        return conn
+
+    def release(self, conn):
+        if not conn.leased:
+            return
+        conn.leased = False
+        try:
+            # Never hand out a connection with a half-finished transaction
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            with self._lock:
+                self._all.remove(conn)
+            conn.dispose()
+        else:
+            self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    def close_all(self):
+        """Close every connection the pool has opened"""
+        with self._lock:
+            connections, self._all = self._all, []
+        for conn in connections:
+            conn.dispose()
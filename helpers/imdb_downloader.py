@@ -1,46 +1,175 @@
+import io
 import os
-import gzip
-import shutil
+import json
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import logging
 from pathlib import Path
 import time
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import HTTPError
+from urllib3.util.retry import Retry
+
+DEFAULT_BASE_URL = 'https://datasets.imdbws.com'
+
+# Streaming buffer per read/write; the datasets are hundreds of MB each
+CHUNK_SIZE = 1024 * 1024
+
+# Attempts per file; later attempts resume from the .part file
+DOWNLOAD_ATTEMPTS = 3
+
+# Download outcomes; both count as success
+DOWNLOADED = 'downloaded'
+NOT_MODIFIED = 'not_modified'
+
+class DatasetStream(io.RawIOBase):
+    """Byte stream of a remote file that reconnects where it left off.
+
+    The body is read straight off the socket as the consumer asks for it, so
+    a slow consumer slows the transfer down (TCP back-pressure) instead of
+    buffering the file. A dropped connection is resumed with a Range request,
+    unless the file changed upstream in the meantime (If-Range).
+    """
+
+    def __init__(self, url, session=None, attempts=DOWNLOAD_ATTEMPTS):
+        self.url = url
+        self.session = session or requests.Session()
+        self.attempts = attempts
+        self.position = 0
+        self.validator = None
+        self.response = None
+        self.connect()
+
+    def connect(self):
+        headers = {}
+        if self.position:
+            headers = {'Range': f'bytes={self.position}-', 'If-Range': self.validator}
+        response = self.session.get(self.url, headers=headers, stream=True, timeout=60)
+        response.raise_for_status()
+        if self.position and response.status_code != 206:
+            response.close()
+            raise IOError(f"{self.url} changed upstream while streaming")
+        if not self.position:
+            self.validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+        self.response = response
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        for attempt in range(1, self.attempts + 1):
+            try:
+                count = self.response.raw.readinto(buffer)
+                self.position += count
+                return count
+            except (HTTPError, requests.RequestException, OSError) as e:
+                logging.info(f"Stream of {self.url} interrupted at byte {self.position}: {str(e)}")
+                self.response.close()
+                if not self.validator or attempt == self.attempts:
+                    raise
+                self.connect()
+
+    def close(self):
+        if self.response is not None:
+            self.response.close()
+        super().close()
+
+
+def open_dataset_stream(url, session=None):
+    """Buffered binary stream of a dataset URL, e.g. for gzip.open()"""
+    return io.BufferedReader(DatasetStream(url, session), CHUNK_SIZE)
 
 class IMDbDatasetDownloader:
-    def __init__(self):
+    def __init__(self, data_dir=None, base_url=DEFAULT_BASE_URL, max_workers=5):
         # Base directory for data storage
-        self.data_dir = Path('D:/Programming/What To Watch/wtwData/data')
-        self.data_dir.mkdir(exist_ok=True)
-        
+        self.data_dir = Path(data_dir or 'D:/Programming/What To Watch/wtwData/data')
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+
         # Create log directory with subdirectory
         self.log_dir = Path('D:/Programming/What To Watch/wtwData/log/download')
         self.log_dir.mkdir(parents=True, exist_ok=True)  # parents=True ensures all parent directories are created
-        
+
         # Setup logging with new log directory
         logging.basicConfig(
             filename=self.log_dir / 'imdb_download.log',
             level=logging.INFO,
             format='%(asctime)s - %(message)s'
         )
-        
+
         # IMDb dataset URLs
+        base_url = base_url.rstrip('/')
         self.datasets = {
-            'title.basics': 'https://datasets.imdbws.com/title.basics.tsv.gz',
-            'name.basics': 'https://datasets.imdbws.com/name.basics.tsv.gz',
-            'title.ratings': 'https://datasets.imdbws.com/title.ratings.tsv.gz',
-            'title.crew': 'https://datasets.imdbws.com/title.crew.tsv.gz',
-            'title.principals': 'https://datasets.imdbws.com/title.principals.tsv.gz'
+            name: f'{base_url}/{name}.tsv.gz'
+            for name in ['title.basics', 'name.basics', 'title.ratings', 'title.crew', 'title.principals']
         }
-        
+
         # Last update tracker file (kept in data directory)
         self.last_update_file = self.data_dir / 'last_update.txt'
 
+        # ETag/Last-Modified of each downloaded file, for conditional requests
+        self.metadata_file = self.data_dir / 'download_metadata.json'
+        self.metadata = self.load_metadata()
+        self.metadata_lock = threading.Lock()
+
+        # One pooled connection per concurrent download; transient failures
+        # (connection errors, 429 and 5xx) are retried with backoff
+        self.max_workers = max_workers
+        self.session = requests.Session()
+        retries = Retry(
+            total=5,
+            backoff_factor=1,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=['GET']
+        )
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers, max_retries=retries)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def load_metadata(self):
+        if not self.metadata_file.exists():
+            return {}
+        with open(self.metadata_file, 'r') as f:
+            return json.load(f)
+
+    def save_metadata(self, filename, response):
+        """Remember the validators of a response for `filename` and persist them"""
+        with self.metadata_lock:
+            # A completed file supersedes the record of its partial download
+            self.metadata.pop(f"{filename}.part", None)
+            self.metadata[filename] = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+            }
+            tmp_path = self.metadata_file.with_name(self.metadata_file.name + '.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump(self.metadata, f, indent=2)
+            os.replace(tmp_path, self.metadata_file)
+
+    def request_headers(self, filename, part_path):
+        """Conditional headers for a fresh download, or Range headers to resume one"""
+        headers = {}
+        if part_path.exists():
+            # Resume only if the file is still the version the part came from
+            partial = self.metadata.get(part_path.name, {})
+            validator = partial.get('etag') or partial.get('last_modified')
+            if validator:
+                headers['Range'] = f'bytes={part_path.stat().st_size}-'
+                headers['If-Range'] = validator
+        elif (self.data_dir / filename).exists():
+            current = self.metadata.get(filename, {})
+            if current.get('etag'):
+                headers['If-None-Match'] = current['etag']
+            if current.get('last_modified'):
+                headers['If-Modified-Since'] = current['last_modified']
+        return headers
+
     def need_update(self):
         """Check if we need to update the datasets"""
         if not self.last_update_file.exists():
             return True
-            
+
         with open(self.last_update_file, 'r') as f:
             last_update = datetime.fromisoformat(f.read().strip())
             current_time = datetime.now()
@@ -48,47 +177,98 @@ class IMDbDatasetDownloader:
             return (current_time - last_update).days >= 1
 
     def download_file(self, url, filename):
-        """Download a file with progress tracking"""
+        """Download a file, retrying interrupted transfers from where they stopped"""
+        for attempt in range(1, DOWNLOAD_ATTEMPTS + 1):
+            result = self.fetch_file(url, filename)
+            if result:
+                return result
+            logging.info(f"Attempt {attempt}/{DOWNLOAD_ATTEMPTS} for {filename} failed")
+        return None
+
+    def fetch_file(self, url, filename):
+        """Download a file unless it is unchanged, resuming a previous partial download.
+
+        Data is streamed into `<filename>.part`, which only replaces the
+        previous file once it is complete. Returns DOWNLOADED or NOT_MODIFIED,
+        or None on failure (the .part file is kept for the next attempt).
+        """
+        file_path = self.data_dir / filename
+        part_path = self.data_dir / f"{filename}.part"
         try:
-            response = requests.get(url, stream=True)
-            response.raise_for_status()
-            
-            total_size = int(response.headers.get('content-length', 0))
-            file_path = self.data_dir / filename
-            
-            logging.info(f"Downloading {filename}")
-            with open(file_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
+            headers = self.request_headers(filename, part_path)
+            with self.session.get(url, headers=headers, stream=True, timeout=60) as response:
+                if response.status_code == 304:
+                    logging.info(f"{filename} not modified")
+                    return NOT_MODIFIED
+
+                if response.status_code == 416:
+                    # The part is unusable (e.g. already complete); start over
+                    logging.info(f"Discarding unusable partial download of {filename}")
+                    part_path.unlink()
+                    return self.fetch_file(url, filename)
+
+                response.raise_for_status()
+
+                if response.status_code == 206:
+                    mode = 'ab'
+                    done = part_path.stat().st_size
+                    logging.info(f"Resuming {filename} at byte {done}")
+                else:
+                    mode = 'wb'
+                    done = 0
+                    # Validators of the version being written, for resuming it later
+                    self.save_metadata(part_path.name, response)
+                    logging.info(f"Downloading {filename}")
+
+                expected = response.headers.get('content-length')
+                expected = done + int(expected) if expected is not None else None
+
+                with open(part_path, mode) as f:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
                         f.write(chunk)
-            
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            size = part_path.stat().st_size
+            if expected is not None and size != expected:
+                raise IOError(f"incomplete download ({size} of {expected} bytes)")
+
+            os.replace(part_path, file_path)
+            self.save_metadata(filename, response)
+
             logging.info(f"Successfully downloaded {filename}")
-            return True
-            
+            return DOWNLOADED
+
         except Exception as e:
             logging.error(f"Error downloading {filename}: {str(e)}")
-            return False
+            return None
 
     def update_datasets(self):
-        """Download and update all datasets"""
+        """Download and update all datasets concurrently.
+
+        Returns {filename: DOWNLOADED | NOT_MODIFIED | None}, or None when
+        the datasets were updated less than 24 hours ago.
+        """
         if not self.need_update():
             logging.info("Datasets are up to date")
-            return
-        
-        success = True
-        for name, url in self.datasets.items():
-            filename = f"{name}.tsv.gz"
-            if not self.download_file(url, filename):
-                success = False
-                break
-                
-        if success:
+            return None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                f"{name}.tsv.gz": executor.submit(self.download_file, url, f"{name}.tsv.gz")
+                for name, url in self.datasets.items()
+            }
+            results = {filename: future.result() for filename, future in futures.items()}
+
+        if all(results.values()):
             # Update the last update timestamp
             with open(self.last_update_file, 'w') as f:
                 f.write(datetime.now().isoformat())
             logging.info("All datasets successfully updated")
         else:
-            logging.error("Failed to update all datasets")
+            failed = [filename for filename, result in results.items() if not result]
+            logging.error(f"Failed to update datasets: {', '.join(failed)}")
+        return results
 
 def main():
     downloader = IMDbDatasetDownloader()
@@ -106,4 +286,4 @@ def main():
             time.sleep(60 * 60)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
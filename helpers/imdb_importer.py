@@ -1,21 +1,276 @@
+import argparse
 import pandas as pd
 import sqlite3
 import gzip
+import multiprocessing
+import os
+import sys
+import time
+from contextlib import contextmanager
+from queue import Empty
 from pathlib import Path
 import logging
 from datetime import datetime
 
+# Allow running as a script from the helpers directory
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from catalog import catalog_file_path, export_catalog, latest_catalog_file
+from db import configure_connection
+from schema import (
+    CATALOG_INDEXES, CATALOG_TABLES, CATALOG_TABLES_SQL,
+    create_shadow_indexes, create_tables, ensure_schema, shadow_table_sql
+)
+from search import (
+    create_search_triggers, drop_search_triggers, has_search_index, normalize_title,
+    rebuild_search_index, search_index_sql, search_rows_sql
+)
+
+# Rows per DataFrame chunk; bounds peak memory no matter how large a dump is
+IMPORT_CHUNK_SIZE = 100_000
+
+# Parsed chunks a parser process may run ahead of the writer, per dataset
+PIPELINE_QUEUE_SIZE = 4
+
+# Seconds the writer waits on a parser's queue before checking the parser is alive
+PIPELINE_POLL_SECONDS = 5
+
+# Rows copied into the live database per transaction when publishing
+PUBLISH_BATCH_SIZE = 50_000
+
+# Catalog tables whose ids survive re-imports, by natural key. User tables
+# reference media (and genres, via preferences) by id.
+KEEP_IDS = {'media': 'imdb_id', 'people': 'imdb_id', 'genres': 'name'}
+
+# Delta imports diff one-row-per-key tables row by row, and link tables as
+# whole groups of rows per title
+DELTA_KEYS = {'media': 'id', 'people': 'id', 'genres': 'id', 'ratings': 'media_id'}
+DELTA_GROUPS = {'media_genres': 'media_id', 'media_people': 'media_id'}
+
+# Titles the user tables point at; kept even when they leave the dataset
+REFERENCED_MEDIA_SQL = """
+    SELECT media_id FROM watch_history
+    UNION SELECT media_id FROM watchlist
+    UNION SELECT item_id FROM favorites WHERE item_type = 'media'
+"""
+
+
+def open_source(source, filename):
+    """Binary stream of a dataset, from a data directory or straight from an HTTP(S) base URL.
+
+    Streamed datasets are gunzipped and parsed while the bytes arrive and
+    never touch the disk; the parser's bounded queue throttles the download.
+    """
+    source = str(source)
+    if source.startswith(('http://', 'https://')):
+        from imdb_downloader import open_dataset_stream
+        return open_dataset_stream(f"{source.rstrip('/')}/{filename}")
+    return open(Path(source) / filename, 'rb')
+
+
+def read_tsv_chunks(stream, chunksize, **kwargs):
+    """Parse a binary .tsv.gz stream as DataFrames of at most `chunksize` rows"""
+    with stream, gzip.open(stream, 'rt', encoding='utf-8') as f:
+        yield from pd.read_csv(f, sep='\t', chunksize=chunksize, **kwargs)
+
+
+def parse_titles(chunks):
+    """Clean title.basics chunks into (media rows, (imdb_id, genre) pairs, genre names)"""
+    for df in chunks:
+        # Split genre lists into one (row, genre) entry each; '\\N' is IMDb's null value
+        genre_lists = df['genres'].dropna()
+        genre_lists = genre_lists[genre_lists != '\\N']
+        title_genres = genre_lists.str.split(',').explode()
+        
+        # Filter only movies and TV shows
+        df = df[df['titleType'].isin(['movie', 'tvMovie', 'tvSeries'])]
+        
+        # Remove entries with empty titles
+        df = df.dropna(subset=['primaryTitle'])
+        
+        # Map columns to our schema
+        media_data = df.rename(columns={
+            'tconst': 'imdb_id',
+            'primaryTitle': 'title',
+            'originalTitle': 'original_title',
+            'titleType': 'type',
+            'startYear': 'year',
+            'runtimeMinutes': 'runtime_minutes',
+        })
+        
+        # Clean up the data
+        media_data['type'] = media_data['type'].map({
+            'movie': 'movie',
+            'tvMovie': 'movie',
+            'tvSeries': 'tv'
+        })
+        
+        # Convert year and runtime to integer, handling invalid values
+        media_data['year'] = pd.to_numeric(media_data['year'], errors='coerce')
+        media_data['runtime_minutes'] = pd.to_numeric(media_data['runtime_minutes'], errors='coerce')
+        
+        # Fill NULL values with appropriate defaults
+        media_data['title'] = media_data['title'].fillna('')  # Ensure no NULL titles
+        media_data['original_title'] = media_data['original_title'].fillna('')
+        media_data['plot'] = None
+        media_data['poster_url'] = None
+        
+        # Normalized (lowercased, accent-folded) key for indexed title search
+        media_data['search_key'] = media_data['title'].map(normalize_title)
+        
+        # Select and order columns according to schema
+        columns = ['imdb_id', 'title', 'original_title', 'type', 'year', 
+                'runtime_minutes', 'plot', 'poster_url', 'search_key']
+        media_data = media_data[columns]
+        
+        # Additional data validation
+        media_data = media_data[
+            (media_data['imdb_id'].notna()) &  # Ensure imdb_id is not null
+            (media_data['title'].str.len() > 0) &  # Ensure title is not empty
+            (media_data['type'].isin(['movie', 'tv']))  # Ensure valid type
+        ]
+        
+        # Keep the genre pairs of the titles we import
+        media_genres = title_genres[title_genres.index.isin(media_data.index)]
+        media_genres = pd.DataFrame({
+            'imdb_id': media_data['imdb_id'].reindex(media_genres.index),
+            'genre': media_genres
+        })
+        
+        yield media_data, media_genres, set(title_genres.unique())
+
+
+def parse_people(chunks):
+    """Clean name.basics chunks into people rows"""
+    for df in chunks:
+        # Remove entries with empty names
+        df = df.dropna(subset=['primaryName'])
+        
+        people_data = df.rename(columns={
+            'nconst': 'imdb_id',
+            'primaryName': 'name',
+            'birthYear': 'birth_year',
+            'deathYear': 'death_year',
+            'primaryProfession': 'primary_profession'
+        })
+        
+        # Clean up the data
+        people_data['name'] = people_data['name'].fillna('')  # Ensure no NULL names
+        people_data['birth_year'] = pd.to_numeric(people_data['birth_year'], errors='coerce')
+        people_data['death_year'] = pd.to_numeric(people_data['death_year'], errors='coerce')
+        people_data['primary_profession'] = people_data['primary_profession'].fillna('')
+        
+        # Additional data validation
+        people_data = people_data[
+            (people_data['imdb_id'].notna()) &  # Ensure imdb_id is not null
+            (people_data['name'].str.len() > 0)  # Ensure name is not empty
+        ]
+        
+        # Select only the columns we need in the correct order
+        columns = ['imdb_id', 'name', 'birth_year', 'death_year', 'primary_profession']
+        yield people_data[columns]
+
+
+def parse_ratings(chunks):
+    """Clean title.ratings chunks into ratings rows keyed by imdb_id"""
+    for df in chunks:
+        yield df.rename(columns={
+            'tconst': 'imdb_id',
+            'averageRating': 'average_rating',
+            'numVotes': 'num_votes'
+        })
+
+
+def parse_principals(chunks):
+    """Clean title.principals chunks into cast/crew rows keyed by imdb_ids"""
+    for df in chunks:
+        # Filter relevant categories
+        df = df[df['category'].isin(['actor', 'actress', 'director', 'writer'])]
+        
+        media_people_data = df.rename(columns={
+            'tconst': 'media_imdb_id',
+            'nconst': 'person_imdb_id',
+            'category': 'role',
+            'characters': 'character_name'
+        })
+        
+        # Combine actor/actress into just 'actor'
+        media_people_data['role'] = media_people_data['role'].replace({
+            'actress': 'actor'
+        })
+        yield media_people_data
+
+
+# Dataset -> (file, read_csv options, parser). Parsers only clean DataFrames,
+# so they can run in worker processes while a single writer loads SQLite.
+# Listed in load order: ratings and principals resolve ids against media/people.
+SOURCES = {
+    'titles': (
+        'title.basics.tsv.gz',
+        {'usecols': ['tconst', 'titleType', 'primaryTitle', 'originalTitle',
+                     'startYear', 'runtimeMinutes', 'genres'],
+         'dtype': {'primaryTitle': str, 'originalTitle': str}},
+        parse_titles
+    ),
+    'people': (
+        'name.basics.tsv.gz',
+        {'usecols': ['nconst', 'primaryName', 'birthYear', 'deathYear', 'primaryProfession'],
+         'dtype': {'primaryName': str, 'primaryProfession': str}},
+        parse_people
+    ),
+    'ratings': ('title.ratings.tsv.gz', {}, parse_ratings),
+    'principals': (
+        'title.principals.tsv.gz',
+        {'usecols': ['tconst', 'nconst', 'category', 'characters'],
+         'dtype': {'characters': str}},
+        parse_principals
+    ),
+}
+
+
+def bulk_insert(conn, table, df):
+    """executemany INSERT of a DataFrame's rows (NaN is stored as NULL); returns the row count"""
+    columns = ', '.join(df.columns)
+    placeholders = ', '.join('?' * len(df.columns))
+    conn.executemany(
+        f"INSERT INTO {table} ({columns}) VALUES ({placeholders})",
+        df.itertuples(index=False, name=None)
+    )
+    return len(df)
+
+
+def parse_source(name, source, chunksize):
+    """Parsed chunks of one dataset from SOURCES, read from `source` (see open_source)"""
+    filename, options, parser = SOURCES[name]
+    yield from parser(read_tsv_chunks(open_source(source, filename), chunksize, **options))
+
+
+def _parse_worker(name, source, chunksize, queue):
+    """Parser process: put the parsed chunks of one dataset on a bounded queue"""
+    start = time.perf_counter()
+    try:
+        for chunk in parse_source(name, source, chunksize):
+            queue.put(('chunk', chunk))
+    except Exception as e:
+        queue.put(('error', f"{name}: {str(e)}"))
+    else:
+        queue.put(('done', time.perf_counter() - start))
+
+
 class IMDbDataImporter:
     
     
-    def __init__(self):
+    def __init__(self, chunksize=IMPORT_CHUNK_SIZE, data_dir=None, db_path=None, log_dir=None):
         print("\n=== Starting IMDb Data Import Process ===")
         # Setup paths
-        self.data_dir = Path(r"D:\Programming\What To Watch\wtwData\data")
-        self.db_path = Path(r"D:\Programming\What To Watch\wtwData\movies.db")
+        self.data_dir = Path(data_dir or r"D:\Programming\What To Watch\wtwData\data")
+        # Base URL to stream the datasets from instead of data_dir
+        self.source = None
+        self.db_path = Path(db_path or r"D:\Programming\What To Watch\wtwData\movies.db")
+        self.chunksize = chunksize
+        self.timings = {}
         
         # Create log directory
-        self.log_dir = Path(r"D:\Programming\What To Watch\wtwData\log\import")
+        self.log_dir = Path(log_dir or r"D:\Programming\What To Watch\wtwData\log\import")
         self.log_dir.mkdir(parents=True, exist_ok=True)  # Create directory if it doesn't exist
         
         # Setup logging with new path
@@ -32,6 +287,8 @@ class IMDbDataImporter:
     def connect_db(self):
         try:
             conn = sqlite3.connect(self.db_path)
+            # WAL + bulk-load pragmas so the site keeps reading during the import
+            configure_connection(conn, 'bulk')
             # Enable foreign keys
             conn.execute("PRAGMA foreign_keys=ON")
             return conn
@@ -42,41 +299,131 @@ class IMDbDataImporter:
             raise
         
 
-    def clear_tables(self):
-        """Clear all existing data from tables"""
+    @property
+    def dataset_source(self):
+        """Where the datasets are read from: `source` if set, else data_dir"""
+        return self.source or self.data_dir
+        
+
+    @property
+    def staging_path(self):
+        """Private database file the datasets are loaded into before publishing"""
+        return self.db_path.with_name(self.db_path.name + '.staging')
+        
+
+    def connect_staging(self):
+        # No journal, fsync, foreign keys or secondary indexes while loading
+        return configure_connection(sqlite3.connect(self.staging_path), 'load')
+        
+
+    @contextmanager
+    def timed(self, step):
+        """Record the wall time of an import step in self.timings"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[step] = time.perf_counter() - start
+            logging.info(f"Step '{step}' took {self.timings[step]:.2f}s")
+        
+
+    def report_timings(self):
+        print("\nStep timings:")
+        for step, seconds in self.timings.items():
+            print(f"- {step}: {seconds:.2f}s")
+        
+
+    def append_resolved(self, conn, chunk, staging_table, insert_sql):
+        """Insert a chunk whose IMDb ids are resolved to database ids by SQLite.
+
+        The chunk is staged in a TEMP table and `insert_sql` joins it against
+        the unique imdb_id indexes, so no imdb_id -> id mapping (tens of
+        millions of entries for people) has to be held in Python.
+        """
+        conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS {staging_table} ({', '.join(chunk.columns)})")
+        conn.execute(f"DELETE FROM {staging_table}")
+        bulk_insert(conn, staging_table, chunk)
+        return conn.execute(insert_sql).rowcount
+        
+
+    def insert_keeping_ids(self, conn, table, df):
+        """Append rows to a KEEP_IDS table, reusing the live id of every known key.
+
+        New keys get ids above every id given out before (see
+        catalog_id_marks) and every staged id, in file order, so an id never
+        moves to a different title, person or genre between imports, even
+        after the row that held it was dropped.
+        """
+        key = KEEP_IDS[table]
+        columns = ', '.join(df.columns)
+        conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS new_{table} ({columns})")
+        conn.execute(f"DELETE FROM new_{table}")
+        bulk_insert(conn, f"new_{table}", df)
+        
+        last_id = conn.execute(f"""
+            SELECT MAX(COALESCE((SELECT last_id FROM live_id_marks WHERE table_name = '{table}'), 0),
+                       COALESCE((SELECT MAX(id) FROM {table}), 0))
+        """).fetchone()[0]
+        conn.execute(f"""
+            INSERT INTO {table} (id, {columns})
+            SELECT COALESCE(l.id, ? + ROW_NUMBER() OVER (PARTITION BY l.id IS NULL ORDER BY n.rowid)),
+                {', '.join(f'n.{column}' for column in df.columns)}
+            FROM new_{table} n
+            LEFT JOIN live_{table}_ids l ON l.{key} = n.{key}
+            ORDER BY n.rowid
+        """, (last_id,))
+        return len(df)
+        
+
+    def initialize_schema(self):
+        """Create missing tables, columns and indexes"""
         try:
-            logging.info("Clearing existing data from tables")
-            print("\nStarting to clear existing data...")
+            logging.info("Ensuring database schema")
             conn = self.connect_db()
-            cursor = conn.cursor()
-            
-            # Temporarily disable foreign key constraints
-            cursor.execute("PRAGMA foreign_keys=OFF")
+            ensure_schema(conn)
+            logging.info("Database schema is up to date")
+            print("✅ Database schema ready!")
             
-            # Clear tables in correct order to handle dependencies
-            tables = [
-                'media_people',
-                'media_genres',
-                'ratings',
-                'genres',
-                'people',
-                'media'
-            ]
-            
-            for table in tables:
-                logging.info(f"Clearing table: {table}")
-                print(f"Clearing table: {table}...")
-                cursor.execute(f"DELETE FROM {table}")
-            
-            # Re-enable foreign key constraints
-            cursor.execute("PRAGMA foreign_keys=ON")
+        except Exception as e:
+            error_msg = f"Error creating schema: {str(e)}"
+            logging.error(error_msg)
+            print(f"❌ {error_msg}")
+            raise
+        finally:
+            if conn:
+                conn.close()
+                
+
+    def prepare_staging(self):
+        """Start a fresh staging file with the catalog tables and no secondary indexes"""
+        try:
+            logging.info(f"Preparing staging database {self.staging_path}")
+            self.staging_path.unlink(missing_ok=True)
+            conn = self.connect_staging()
+            create_tables(conn, CATALOG_TABLES_SQL)
             
+            # Snapshot the live ids so known titles, people and genres keep
+            # them, and the highest ids given out so new keys get fresh ones
+            live = self.connect_db()
+            try:
+                conn.execute("CREATE TABLE live_id_marks (table_name TEXT PRIMARY KEY, last_id INTEGER)")
+                for table, key in KEEP_IDS.items():
+                    conn.execute(f"CREATE TABLE live_{table}_ids (id INTEGER PRIMARY KEY, {key} TEXT UNIQUE)")
+                    conn.executemany(
+                        f"INSERT INTO live_{table}_ids VALUES (?, ?)",
+                        live.execute(f"SELECT id, {key} FROM {table}")
+                    )
+                    conn.execute("INSERT INTO live_id_marks VALUES (?, ?)", live.execute(f"""
+                        SELECT ?, MAX(COALESCE((SELECT last_id FROM catalog_id_marks WHERE table_name = ?), 0),
+                                      COALESCE((SELECT MAX(id) FROM {table}), 0))
+                    """, (table, table)).fetchone())
+            finally:
+                live.close()
             conn.commit()
-            logging.info("Successfully cleared all tables")
-            print("✅ All tables cleared successfully!")
+            print("✅ Staging database ready!")
             
         except Exception as e:
-            error_msg = f"Error clearing tables: {str(e)}"
+            error_msg = f"Error preparing staging database: {str(e)}"
             logging.error(error_msg)
             print(f"❌ {error_msg}")
             raise
@@ -85,71 +432,53 @@ class IMDbDataImporter:
                 conn.close()
                 
 
-    def import_media(self):
-        """Import media data from title.basics.tsv.gz"""
+    def import_titles(self, chunks=None):
+        """Import media, genres and media-genre relationships in one pass over title.basics.tsv.gz.
+
+        New genres get ids in name order once every genre has been seen, so
+        the media-genre pairs are staged by imdb_id and genre name and
+        resolved to ids after the pass.
+        """
         try:
-            logging.info("Starting media import")
-            print("\nReading media data...")
-            conn = self.connect_db()
+            logging.info("Starting titles import")
+            print("\nReading and importing media, genres and media-genre data...")
+            conn = self.connect_staging()
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS staging_media_genres (imdb_id, genre)")
+            conn.execute("DELETE FROM staging_media_genres")
             
-            with gzip.open(self.data_dir / 'title.basics.tsv.gz', 'rt', encoding='utf-8') as f:
-                df = pd.read_csv(f, sep='\t', low_memory=False)
-                
-                print("Processing media data...")
-                # Filter only movies and TV shows
-                df = df[df['titleType'].isin(['movie', 'tvMovie', 'tvSeries'])]
-                
-                # Remove entries with empty titles
-                df = df.dropna(subset=['primaryTitle'])
-                
-                # Map columns to our schema
-                media_data = df.rename(columns={
-                    'tconst': 'imdb_id',
-                    'primaryTitle': 'title',
-                    'originalTitle': 'original_title',
-                    'titleType': 'type',
-                    'startYear': 'year',
-                    'runtimeMinutes': 'runtime_minutes',
-                })
-                
-                # Clean up the data
-                media_data['type'] = media_data['type'].map({
-                    'movie': 'movie',
-                    'tvMovie': 'movie',
-                    'tvSeries': 'tv'
-                })
-                
-                # Convert year and runtime to integer, handling invalid values
-                media_data['year'] = pd.to_numeric(media_data['year'], errors='coerce')
-                media_data['runtime_minutes'] = pd.to_numeric(media_data['runtime_minutes'], errors='coerce')
-                
-                # Fill NULL values with appropriate defaults
-                media_data['title'] = media_data['title'].fillna('')  # Ensure no NULL titles
-                media_data['original_title'] = media_data['original_title'].fillna('')
-                media_data['plot'] = None
-                media_data['poster_url'] = None
-                
-                # Select and order columns according to schema
-                columns = ['imdb_id', 'title', 'original_title', 'type', 'year', 
-                        'runtime_minutes', 'plot', 'poster_url']
-                media_data = media_data[columns]
-                
-                # Additional data validation
-                media_data = media_data[
-                    (media_data['imdb_id'].notna()) &  # Ensure imdb_id is not null
-                    (media_data['title'].str.len() > 0) &  # Ensure title is not empty
-                    (media_data['type'].isin(['movie', 'tv']))  # Ensure valid type
-                ]
-                
-                print(f"Importing {len(media_data)} media records...")
-                # Import to database
-                media_data.to_sql('media', conn, if_exists='append', index=False)
+            if chunks is None:
+                chunks = parse_source('titles', self.dataset_source, self.chunksize)
+            
+            total = 0
+            genres = set()
+            for media_data, media_genres, chunk_genres in chunks:
+                total += self.insert_keeping_ids(conn, 'media', media_data)
+                bulk_insert(conn, 'staging_media_genres', media_genres)
+                genres.update(chunk_genres)
+                logging.info(f"Imported {total} media entries so far")
                 
-                logging.info(f"Imported {len(media_data)} media entries")
-                print("✅ Media import completed successfully!")
+            logging.info(f"Imported {total} media entries")
+            print(f"✅ Imported {total} media records!")
+            
+            genres_data = pd.DataFrame({'name': sorted(genres)})
+            self.insert_keeping_ids(conn, 'genres', genres_data)
+            logging.info(f"Imported {len(genres_data)} genres")
+            print(f"✅ Imported {len(genres_data)} unique genres!")
+            
+            cursor = conn.execute("""
+                INSERT INTO media_genres (media_id, genre_id)
+                SELECT m.id, g.id
+                FROM staging_media_genres s
+                CROSS JOIN media m ON m.imdb_id = s.imdb_id
+                CROSS JOIN genres g ON g.name = s.genre
+            """)
+            conn.execute("DELETE FROM staging_media_genres")
+            conn.commit()
+            logging.info(f"Imported {cursor.rowcount} media_genres entries")
+            print(f"✅ Imported {cursor.rowcount} media-genre relationships!")
                 
         except Exception as e:
-            error_msg = f"Error importing media: {str(e)}"
+            error_msg = f"Error importing titles: {str(e)}"
             logging.error(error_msg)
             print(f"❌ {error_msg}")
             raise
@@ -158,49 +487,24 @@ class IMDbDataImporter:
                 conn.close()
                 
 
-    def import_people(self):
+    def import_people(self, chunks=None):
         """Import people data from name.basics.tsv.gz"""
         try:
             logging.info("Starting people import")
-            print("\nReading people data...")
-            conn = self.connect_db()
+            print("\nReading and importing people data...")
+            conn = self.connect_staging()
             
-            with gzip.open(self.data_dir / 'name.basics.tsv.gz', 'rt', encoding='utf-8') as f:
-                df = pd.read_csv(f, sep='\t', low_memory=False)
-                
-                print("Processing people data...")
-                # Remove entries with empty names
-                df = df.dropna(subset=['primaryName'])
-                
-                people_data = df.rename(columns={
-                    'nconst': 'imdb_id',
-                    'primaryName': 'name',
-                    'birthYear': 'birth_year',
-                    'deathYear': 'death_year',
-                    'primaryProfession': 'primary_profession'
-                })
-                
-                # Clean up the data
-                people_data['name'] = people_data['name'].fillna('')  # Ensure no NULL names
-                people_data['birth_year'] = pd.to_numeric(people_data['birth_year'], errors='coerce')
-                people_data['death_year'] = pd.to_numeric(people_data['death_year'], errors='coerce')
-                people_data['primary_profession'] = people_data['primary_profession'].fillna('')
-                
-                # Additional data validation
-                people_data = people_data[
-                    (people_data['imdb_id'].notna()) &  # Ensure imdb_id is not null
-                    (people_data['name'].str.len() > 0)  # Ensure name is not empty
-                ]
-                
-                # Select only the columns we need in the correct order
-                columns = ['imdb_id', 'name', 'birth_year', 'death_year', 'primary_profession']
-                people_data = people_data[columns]
-                
-                print(f"Importing {len(people_data)} people records...")
-                people_data.to_sql('people', conn, if_exists='append', index=False)
+            if chunks is None:
+                chunks = parse_source('people', self.dataset_source, self.chunksize)
+            
+            total = 0
+            for people_data in chunks:
+                total += self.insert_keeping_ids(conn, 'people', people_data)
+                logging.info(f"Imported {total} people entries so far")
+            conn.commit()
                 
-                logging.info(f"Imported {len(people_data)} people entries")
-                print("✅ People import completed successfully!")
+            logging.info(f"Imported {total} people entries")
+            print(f"✅ Imported {total} people records!")
                 
         except Exception as e:
             error_msg = f"Error importing people: {str(e)}"
@@ -212,39 +516,30 @@ class IMDbDataImporter:
                 conn.close()
                 
 
-    def import_ratings(self):
+    def import_ratings(self, chunks=None):
         """Import ratings data from title.ratings.tsv.gz"""
         try:
             logging.info("Starting ratings import")
-            print("\nReading ratings data...")
-            conn = self.connect_db()
+            print("\nReading and importing ratings data...")
+            conn = self.connect_staging()
             
-            with gzip.open(self.data_dir / 'title.ratings.tsv.gz', 'rt', encoding='utf-8') as f:
-                df = pd.read_csv(f, sep='\t')
-                
-                print("Processing ratings data...")
-                ratings_data = df.rename(columns={
-                    'tconst': 'media_id',
-                    'averageRating': 'average_rating',
-                    'numVotes': 'num_votes'
-                })
-                
-                # Get the media_id to imdb_id mapping from the media table
-                cursor = conn.cursor()
-                cursor.execute("SELECT id, imdb_id FROM media")
-                media_mapping = {row[1]: row[0] for row in cursor.fetchall()}
-                
-                # Map IMDb IDs to our media table IDs
-                ratings_data['media_id'] = ratings_data['media_id'].map(media_mapping)
-                
-                # Remove rows where we couldn't map the media_id
-                ratings_data = ratings_data.dropna(subset=['media_id'])
-                
-                print(f"Importing {len(ratings_data)} ratings records...")
-                ratings_data.to_sql('ratings', conn, if_exists='append', index=False)
+            if chunks is None:
+                chunks = parse_source('ratings', self.dataset_source, self.chunksize)
+            
+            total = 0
+            for ratings_data in chunks:
+                # Map IMDb IDs to our media table IDs, dropping titles we didn't import
+                total += self.append_resolved(conn, ratings_data, 'staging_ratings', """
+                    INSERT INTO ratings (media_id, average_rating, num_votes)
+                    SELECT m.id, s.average_rating, s.num_votes
+                    FROM staging_ratings s
+                    CROSS JOIN media m ON m.imdb_id = s.imdb_id
+                """)
+                logging.info(f"Imported {total} ratings entries so far")
+            conn.commit()
                 
-                logging.info(f"Imported {len(ratings_data)} ratings entries")
-                print("✅ Ratings import completed successfully!")
+            logging.info(f"Imported {total} ratings entries")
+            print(f"✅ Imported {total} ratings records!")
             
         except Exception as e:
             error_msg = f"Error importing ratings: {str(e)}"
@@ -256,56 +551,31 @@ class IMDbDataImporter:
                 conn.close()
                 
 
-    def import_media_people(self):
+    def import_media_people(self, chunks=None):
         """Import cast and crew data"""
         try:
             logging.info("Starting media_people import")
-            print("\nReading media_people data...")
-            conn = self.connect_db()
+            print("\nReading and importing media_people data...")
+            conn = self.connect_staging()
             
-            with gzip.open(self.data_dir / 'title.principals.tsv.gz', 'rt', encoding='utf-8') as f:
-                df = pd.read_csv(f, sep='\t')
-                
-                print("Processing media_people data...")
-                # Filter relevant categories
-                df = df[df['category'].isin(['actor', 'actress', 'director', 'writer'])]
-                
-                media_people_data = df.rename(columns={
-                    'tconst': 'media_id',
-                    'nconst': 'person_id',
-                    'category': 'role',
-                    'characters': 'character_name'
-                })
-                
-                # Combine actor/actress into just 'actor'
-                media_people_data['role'] = media_people_data['role'].replace({
-                    'actress': 'actor'
-                })
-                
-                # Get ID mappings from database
-                cursor = conn.cursor()
-                cursor.execute("SELECT id, imdb_id FROM media")
-                media_mapping = {row[1]: row[0] for row in cursor.fetchall()}
-                
-                cursor.execute("SELECT id, imdb_id FROM people")
-                people_mapping = {row[1]: row[0] for row in cursor.fetchall()}
-                
-                # Map IMDb IDs to our database IDs
-                media_people_data['media_id'] = media_people_data['media_id'].map(media_mapping)
-                media_people_data['person_id'] = media_people_data['person_id'].map(people_mapping)
-                
-                # Remove rows where we couldn't map either ID
-                media_people_data = media_people_data.dropna(subset=['media_id', 'person_id'])
-                
-                # Select only the columns we need
-                columns = ['media_id', 'person_id', 'role', 'character_name']
-                media_people_data = media_people_data[columns]
-                
-                print(f"Importing {len(media_people_data)} media_people records...")
-                media_people_data.to_sql('media_people', conn, if_exists='append', index=False)
+            if chunks is None:
+                chunks = parse_source('principals', self.dataset_source, self.chunksize)
+            
+            total = 0
+            for media_people_data in chunks:
+                # Map IMDb IDs to our database IDs, dropping rows where either is unknown
+                total += self.append_resolved(conn, media_people_data, 'staging_media_people', """
+                    INSERT INTO media_people (media_id, person_id, role, character_name)
+                    SELECT m.id, p.id, s.role, s.character_name
+                    FROM staging_media_people s
+                    CROSS JOIN media m ON m.imdb_id = s.media_imdb_id
+                    CROSS JOIN people p ON p.imdb_id = s.person_imdb_id
+                """)
+                logging.info(f"Imported {total} media_people entries so far")
+            conn.commit()
                 
-                logging.info(f"Imported {len(media_people_data)} media_people entries")
-                print("✅ Media_people import completed successfully!")
+            logging.info(f"Imported {total} media_people entries")
+            print(f"✅ Imported {total} media_people records!")
                 
         except Exception as e:
             error_msg = f"Error importing media_people: {str(e)}"
@@ -315,122 +585,466 @@ class IMDbDataImporter:
         finally:
             if conn:
                 conn.close()
+                
+
+    def drain(self, name, queue, worker):
+        """Yield the parsed chunks a parser process puts on `queue`.
+
+        Raises if `worker` exits without finishing, e.g. when it is killed
+        for running out of memory.
+        """
+        while True:
+            # Once the worker has exited, whatever it put is already in the pipe
+            timeout = PIPELINE_POLL_SECONDS if worker.is_alive() else 1
+            try:
+                kind, payload = queue.get(timeout=timeout)
+            except Empty:
+                if worker.is_alive():
+                    continue
+                raise RuntimeError(f"Parser process for {name} died (exit code {worker.exitcode})")
+            if kind == 'error':
+                raise RuntimeError(f"Parsing failed for {payload}")
+            if kind == 'done':
+                self.timings[f'parse {name}'] = payload
+                logging.info(f"Parsing {name} took {payload:.2f}s")
+                return
+            yield payload
+            
 
+    def import_datasets(self, parallel=None):
+        """Import every dataset in SOURCES, parsing in worker processes when `parallel`.
 
-    def import_genres(self):
-        """Import genres data from title.basics.tsv.gz"""
+        Each dataset gets its own parser process, which runs up to
+        PIPELINE_QUEUE_SIZE chunks ahead on a bounded queue. This process is
+        the only SQLite writer and drains the queues in load order, so people,
+        ratings and principals are parsed while titles are written. By default
+        parsing only moves to worker processes on multi-core machines.
+        """
+        if parallel is None:
+            parallel = (os.cpu_count() or 1) > 1
+        steps = [
+            ('titles', 'titles', self.import_titles),
+            ('people', 'people', self.import_people),
+            ('ratings', 'ratings', self.import_ratings),
+            ('media_people', 'principals', self.import_media_people),
+        ]
+        
+        if not parallel:
+            for step, _, import_step in steps:
+                with self.timed(step):
+                    import_step()
+            return
+        
+        if 'fork' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('fork')
+        else:
+            context = multiprocessing.get_context('spawn')
+        
+        queues = {}
+        workers = {}
+        for name in SOURCES:
+            queues[name] = context.Queue(PIPELINE_QUEUE_SIZE)
+            workers[name] = context.Process(
+                target=_parse_worker,
+                args=(name, str(self.dataset_source), self.chunksize, queues[name]),
+                daemon=True
+            )
+            workers[name].start()
+        
         try:
-            logging.info("Starting genres import")
-            print("\nReading genres data...")
+            for step, source, import_step in steps:
+                with self.timed(step):
+                    import_step(self.drain(source, queues[source], workers[source]))
+        except BaseException:
+            # Parsers blocked on a full queue would otherwise never exit
+            for worker in workers.values():
+                worker.terminate()
+            raise
+        finally:
+            for worker in workers.values():
+                worker.join()
+                
+
+    def publish_staging(self):
+        """Swap the staged catalog into the live database.
+
+        The staged tables are first copied into <table>_shadow tables, which
+        already carry their secondary indexes, and the search index is built
+        as media_fts_shadow. Both happen in batches of PUBLISH_BATCH_SIZE rows,
+        each in its own short transaction, so the site's own writes go through
+        meanwhile. One transaction then only drops the old catalog tables and
+        renames the shadows into place. Readers see the old catalog until that
+        commit and the new one after it.
+        
+        As in apply_delta, titles that have left the dataset but are still in
+        someone's watch history, watchlist or favorites are retired, not
+        dropped: they are carried into the shadows with their genres, ratings
+        and credits, in that same transaction so a title watched meanwhile is
+        kept too. Stored recommendations for dropped titles are deleted.
+        """
+        try:
+            logging.info("Publishing staged catalog")
+            print("\nPublishing staged catalog...")
             conn = self.connect_db()
+            # User tables reference the catalog; their REFERENCES clauses
+            # follow the table names, which end up unchanged
+            conn.execute("PRAGMA foreign_keys=OFF")
+            conn.execute("ATTACH DATABASE ? AS staging", (str(self.staging_path),))
+            
+            # Empty shadows with their indexes; the copy below maintains them
+            for table in CATALOG_TABLES:
+                conn.execute(f"DROP TABLE IF EXISTS main.{table}_shadow")
+                conn.execute(shadow_table_sql(table, f"{table}_shadow"))
+            create_shadow_indexes(conn, CATALOG_INDEXES)
+            conn.execute("DROP TABLE IF EXISTS main.media_fts_shadow")
+            conn.execute(search_index_sql('_shadow'))
+            conn.commit()
+            
+            for table in CATALOG_TABLES:
+                shadow = f"{table}_shadow"
+                columns = ', '.join(row[1] for row in conn.execute(f"PRAGMA staging.table_info({table})"))
+                last_rowid = 0
+                while True:
+                    upper = conn.execute(f"""
+                        SELECT MAX(r) FROM (
+                            SELECT rowid AS r FROM staging.{table}
+                            WHERE rowid > ? ORDER BY rowid LIMIT ?
+                        )
+                    """, (last_rowid, PUBLISH_BATCH_SIZE)).fetchone()[0]
+                    if upper is None:
+                        break
+                    conn.execute(f"""
+                        INSERT INTO main.{shadow} ({columns})
+                        SELECT {columns} FROM staging.{table}
+                        WHERE rowid > ? AND rowid <= ?
+                    """, (last_rowid, upper))
+                    conn.commit()
+                    last_rowid = upper
+                logging.info(f"Copied {table} into {shadow}")
+            
+            low = conn.execute("SELECT MIN(id) FROM main.media_shadow").fetchone()[0]
+            while low is not None:
+                high = conn.execute("""
+                    SELECT MAX(id) FROM (
+                        SELECT id FROM main.media_shadow WHERE id >= ? ORDER BY id LIMIT ?
+                    )
+                """, (low, PUBLISH_BATCH_SIZE)).fetchone()[0]
+                conn.execute(search_rows_sql('_shadow'), {'low': low, 'high': high})
+                conn.commit()
+                low = conn.execute("SELECT MIN(id) FROM main.media_shadow WHERE id > ?", (high,)).fetchone()[0]
+            logging.info("Built media_fts_shadow")
+            
+            conn.execute("BEGIN IMMEDIATE")
+            self.record_id_marks(conn)
+            self.retire_into_shadows(conn)
+            conn.execute("""
+                DELETE FROM user_recommendations WHERE media_id NOT IN (SELECT id FROM main.media_shadow)
+            """)
+            drop_search_triggers(conn)
+            conn.execute("DROP TABLE IF EXISTS main.media_fts")
+            for table in reversed(CATALOG_TABLES):
+                conn.execute(f"DROP TABLE main.{table}")
+            for table in CATALOG_TABLES + ['media_fts']:
+                conn.execute(f"ALTER TABLE main.{table}_shadow RENAME TO {table}")
+            create_search_triggers(conn)
+            conn.commit()
+            conn.execute("DETACH DATABASE staging")
+            
+            logging.info("Staged catalog published")
+            print("✅ Catalog and search index published!")
             
-            with gzip.open(self.data_dir / 'title.basics.tsv.gz', 'rt', encoding='utf-8') as f:
-                df = pd.read_csv(f, sep='\t', low_memory=False)
-                
-                print("Processing genres data...")
-                # Extract unique genres
-                genres = set()
-                for genre_list in df['genres'].dropna():
-                    if genre_list != '\\N':  # IMDb's null value
-                        genres.update(genre_list.split(','))
-                
-                # Convert to DataFrame
-                genres_data = pd.DataFrame({'name': sorted(list(genres))})
-                
-                print(f"Importing {len(genres_data)} unique genres...")
-                genres_data.to_sql('genres', conn, if_exists='append', index=False)
-                
-                logging.info(f"Imported {len(genres_data)} genres")
-                print("✅ Genres import completed successfully!")      
         except Exception as e:
-            error_msg = f"Error importing genres: {str(e)}"
+            error_msg = f"Error publishing staged catalog: {str(e)}"
             logging.error(error_msg)
             print(f"❌ {error_msg}")
             raise
         finally:
             if conn:
                 conn.close()
-                
+        self.staging_path.unlink()
+        
+
+    def retire_into_shadows(self, conn):
+        """Copy live titles the user tables reference but the shadows lack into the shadows.
 
-    def import_media_genres(self):
-        """Import media-genre relationships"""
+        Their ratings, genre and credit links come along, and the genres and
+        people those links need; genres in someone's preferences are kept too.
+        """
+        conn.execute("DROP TABLE IF EXISTS temp.retired_media")
+        conn.execute(f"""
+            CREATE TEMP TABLE retired_media AS
+            SELECT id FROM main.media
+            WHERE id NOT IN (SELECT id FROM main.media_shadow)
+            AND id IN ({REFERENCED_MEDIA_SQL})
+        """)
+        # Parents first, each only where the shadow lacks the row
+        retired = {
+            'media': "id IN (SELECT id FROM retired_media)",
+            'people': """id NOT IN (SELECT id FROM main.people_shadow) AND id IN (
+                SELECT person_id FROM main.media_people
+                WHERE media_id IN (SELECT id FROM retired_media))""",
+            'genres': """id NOT IN (SELECT id FROM main.genres_shadow) AND (
+                id IN (SELECT genre_id FROM user_preferences) OR id IN (
+                SELECT genre_id FROM main.media_genres
+                WHERE media_id IN (SELECT id FROM retired_media)))""",
+            'media_genres': "media_id IN (SELECT id FROM retired_media)",
+            'media_people': "media_id IN (SELECT id FROM retired_media)",
+            'ratings': "media_id IN (SELECT id FROM retired_media)",
+        }
+        for table in CATALOG_TABLES:
+            columns = ', '.join(row[1] for row in conn.execute(f"PRAGMA main.table_info({table}_shadow)"))
+            count = conn.execute(f"""
+                INSERT INTO main.{table}_shadow ({columns})
+                SELECT {columns} FROM main.{table} WHERE {retired[table]}
+            """).rowcount
+            logging.info(f"Kept {count} retired {table} entries")
+        conn.executemany(search_rows_sql('_shadow'), (
+            {'low': media_id, 'high': media_id}
+            for media_id, in conn.execute("SELECT id FROM retired_media").fetchall()
+        ))
+        
+
+    def record_id_marks(self, conn):
+        """Raise catalog_id_marks to the highest live and staged ids.
+
+        Runs in the publish or delta transaction, before any live row is
+        dropped, with the staging database attached.
+        """
+        for table in KEEP_IDS:
+            conn.execute(f"""
+                INSERT INTO main.catalog_id_marks (table_name, last_id)
+                SELECT ?, MAX(COALESCE((SELECT MAX(id) FROM main.{table}), 0),
+                              COALESCE((SELECT MAX(id) FROM staging.{table}), 0))
+                WHERE true
+                ON CONFLICT (table_name) DO UPDATE SET last_id = MAX(last_id, excluded.last_id)
+            """, (table,))
+        
+
+    def has_catalog(self):
+        """Whether the live database already holds an imported catalog"""
+        conn = self.connect_db()
         try:
-            logging.info("Starting media_genres import")
-            print("\nReading media_genres data...")
+            return conn.execute("SELECT 1 FROM media LIMIT 1").fetchone() is not None
+        finally:
+            conn.close()
+            
+
+    def apply_delta(self):
+        """Apply only the differences between the staged and the live catalog.
+
+        Staged rows already carry the live ids (see insert_keeping_ids), so
+        rows are matched by id. The inserts and updates are worked out first
+        from read-only queries and kept in TEMP tables. They are then applied
+        in a single transaction, together with the deletes, which depend on
+        what the user tables reference and so are worked out under the write
+        lock. The search index is kept in step by its triggers, or built if
+        the database has none yet. Titles that have left the dataset but are still
+        in someone's watch history, watchlist or favorites are retired, not
+        deleted. Their genres, ratings and credits stay as well.
+        Returns the number of rows changed.
+        """
+        try:
+            logging.info("Computing catalog delta")
+            print("\nComputing changes against the live catalog...")
             conn = self.connect_db()
+            conn.execute("ATTACH DATABASE ? AS staging", (str(self.staging_path),))
+            
+            # Keep-if-referenced conditions for rows missing from the staged catalog
+            keep = {
+                'media': "id IN (SELECT id FROM retired_media)",
+                'ratings': "media_id IN (SELECT id FROM retired_media)",
+                'people': """id IN (
+                    SELECT person_id FROM main.media_people
+                    WHERE media_id IN (SELECT id FROM retired_media))""",
+                'genres': """id IN (SELECT genre_id FROM user_preferences) OR id IN (
+                    SELECT genre_id FROM main.media_genres
+                    WHERE media_id IN (SELECT id FROM retired_media))""",
+            }
+            columns = {
+                table: [row[1] for row in conn.execute(f"PRAGMA staging.table_info({table})")]
+                for table in CATALOG_TABLES
+            }
+            
+            for table, key in DELTA_KEYS.items():
+                values = [column for column in columns[table] if column != key]
+                staged = ', '.join(f"s.{column}" for column in values)
+                live = ', '.join(f"l.{column}" for column in values)
+                conn.execute(f"DROP TABLE IF EXISTS temp.{table}_upserts")
+                conn.execute(f"""
+                    CREATE TEMP TABLE {table}_upserts AS
+                    SELECT s.{key} AS key FROM staging.{table} s
+                    LEFT JOIN main.{table} l ON l.{key} = s.{key}
+                    WHERE l.{key} IS NULL OR ({staged}) IS NOT ({live})
+                """)
+            
+            for table, key in DELTA_GROUPS.items():
+                listed = ', '.join(columns[table])
+                conn.execute(f"DROP TABLE IF EXISTS temp.{table}_changes")
+                conn.execute(f"""
+                    CREATE TEMP TABLE {table}_changes AS
+                    SELECT {key} AS key FROM (
+                        SELECT {listed} FROM staging.{table}
+                        EXCEPT SELECT {listed} FROM main.{table}
+                    )
+                    UNION
+                    SELECT {key} FROM (
+                        SELECT {listed} FROM main.{table}
+                        EXCEPT SELECT {listed} FROM staging.{table}
+                    )
+                """)
+            
+            logging.info("Applying catalog delta")
+            conn.execute("BEGIN IMMEDIATE")
+            self.record_id_marks(conn)
+            changed = 0
+            
+            # What the user tables reference is only settled under the write
+            # lock; a title watched since the diff above must not be deleted
+            conn.execute("DROP TABLE IF EXISTS temp.retired_media")
+            conn.execute(f"""
+                CREATE TEMP TABLE retired_media AS
+                SELECT id FROM main.media
+                WHERE id NOT IN (SELECT id FROM staging.media)
+                AND id IN ({REFERENCED_MEDIA_SQL})
+            """)
+            for table, key in DELTA_KEYS.items():
+                conn.execute(f"DROP TABLE IF EXISTS temp.{table}_deletes")
+                conn.execute(f"""
+                    CREATE TEMP TABLE {table}_deletes AS
+                    SELECT {key} AS key FROM main.{table}
+                    WHERE {key} NOT IN (SELECT {key} FROM staging.{table})
+                    AND NOT ({keep[table]})
+                """)
+            for table in DELTA_GROUPS:
+                conn.execute(f"DELETE FROM {table}_changes WHERE key IN (SELECT id FROM retired_media)")
+            
+            # Parents first for inserts and updates
+            for table, key in DELTA_KEYS.items():
+                values = [column for column in columns[table] if column != key]
+                listed = ', '.join(columns[table])
+                updates = ', '.join(f"{column} = excluded.{column}" for column in values)
+                count = conn.execute(f"""
+                    INSERT INTO main.{table} ({listed})
+                    SELECT {listed} FROM staging.{table}
+                    WHERE {key} IN (SELECT key FROM {table}_upserts)
+                    ON CONFLICT ({key}) DO UPDATE SET {updates}
+                """).rowcount
+                changed += count
+                logging.info(f"Inserted or updated {count} {table} entries")
+            
+            # Link tables are replaced per title wherever anything differs
+            for table, key in DELTA_GROUPS.items():
+                listed = ', '.join(columns[table])
+                removed = conn.execute(f"""
+                    DELETE FROM main.{table} WHERE {key} IN (SELECT key FROM {table}_changes)
+                """).rowcount
+                added = conn.execute(f"""
+                    INSERT INTO main.{table} ({listed})
+                    SELECT {listed} FROM staging.{table}
+                    WHERE {key} IN (SELECT key FROM {table}_changes)
+                """).rowcount
+                changed += removed + added
+                logging.info(f"Replaced {table}: {removed} removed, {added} added")
+            
+            # Children first for deletes
+            conn.execute("""
+                DELETE FROM user_recommendations WHERE media_id IN (SELECT key FROM media_deletes)
+            """)
+            for table, key in reversed(DELTA_KEYS.items()):
+                count = conn.execute(f"""
+                    DELETE FROM main.{table} WHERE {key} IN (SELECT key FROM {table}_deletes)
+                """).rowcount
+                changed += count
+                logging.info(f"Deleted {count} {table} entries")
+            
+            # Databases from before the search index (e.g. the downloadable
+            # movies.db) only ever get deltas, so build it here when missing
+            if not has_search_index(conn):
+                logging.info("Building missing search index")
+                rebuild_search_index(conn)
+            
+            conn.commit()
+            conn.execute("DETACH DATABASE staging")
+            
+            logging.info(f"Catalog delta applied: {changed} rows changed")
+            print(f"✅ Applied {changed} catalog changes!")
             
-            with gzip.open(self.data_dir / 'title.basics.tsv.gz', 'rt', encoding='utf-8') as f:
-                df = pd.read_csv(f, sep='\t', low_memory=False)
-                
-                print("Processing media_genres relationships...")
-                # Get mappings
-                cursor = conn.cursor()
-                cursor.execute("SELECT id, imdb_id FROM media")
-                media_mapping = {row[1]: row[0] for row in cursor.fetchall()}
-                
-                cursor.execute("SELECT id, name FROM genres")
-                genre_mapping = {row[1]: row[0] for row in cursor.fetchall()}
-                
-                # Create relationships
-                relationships = []
-                for _, row in df.iterrows():
-                    if pd.notna(row['genres']) and row['genres'] != '\\N':
-                        media_id = media_mapping.get(row['tconst'])
-                        if media_id:
-                            for genre in row['genres'].split(','):
-                                genre_id = genre_mapping.get(genre)
-                                if genre_id:
-                                    relationships.append({
-                                        'media_id': media_id,
-                                        'genre_id': genre_id
-                                    })
-                
-                media_genres_data = pd.DataFrame(relationships)
-                
-                print(f"Importing {len(media_genres_data)} media-genre relationships...")
-                media_genres_data.to_sql('media_genres', conn, if_exists='append', index=False)
-                
-                logging.info(f"Imported {len(media_genres_data)} media_genres entries")
-                print("✅ Media_genres import completed successfully!")
-                
         except Exception as e:
-            error_msg = f"Error importing media_genres: {str(e)}"
+            error_msg = f"Error applying catalog delta: {str(e)}"
             logging.error(error_msg)
             print(f"❌ {error_msg}")
             raise
         finally:
             if conn:
                 conn.close()
+        self.staging_path.unlink()
+        return changed
+        
+
+    def export_catalog(self):
+        """Write the memory-mapped catalog file used by the app and recommender"""
+        try:
+            logging.info("Starting catalog export")
+            catalog_path = export_catalog(self.db_path)
+            
+            logging.info(f"Exported the catalog to {catalog_path}")
+            print(f"✅ Catalog file written to {catalog_path}")
+            
+        except Exception as e:
+            error_msg = f"Error exporting catalog: {str(e)}"
+            logging.error(error_msg)
+            print(f"❌ {error_msg}")
+            raise
                 
 
+def run_import(importer, full=False, parallel=None):
+    """Run every import step; a delta import unless `full` or the database has no catalog.
+
+    `parallel` is passed on to import_datasets().
+    """
+    print("\nStep 1/4: Initializing...")
+    with importer.timed('schema'):
+        importer.initialize_schema()
+        delta = not full and importer.has_catalog()
+        importer.prepare_staging()
+    
+    print("\nStep 2/4: Importing media, genres, people, ratings and relationships...")
+    importer.import_datasets(parallel)
+    
+    if delta:
+        print("\nStep 3/4: Applying catalog changes...")
+        with importer.timed('delta'):
+            changed = importer.apply_delta()
+    else:
+        print("\nStep 3/4: Publishing catalog and search index...")
+        with importer.timed('publish'):
+            importer.publish_staging()
+    
+    print("\nStep 4/4: Exporting catalog file...")
+    if delta and not changed and latest_catalog_file(catalog_file_path(importer.db_path)):
+        print("Catalog unchanged, keeping the current catalog file")
+    else:
+        with importer.timed('catalog'):
+            importer.export_catalog()
+        
+
 def main():
+    parser = argparse.ArgumentParser(description="Import the IMDb datasets into the What to Watch database")
+    parser.add_argument('--full', action='store_true',
+                        help="Rebuild the whole catalog instead of applying only the changes")
+    parser.add_argument('--stream', nargs='?', const='https://datasets.imdbws.com', metavar='BASE_URL',
+                        help="Stream the datasets straight from BASE_URL (default: the IMDb site) "
+                             "instead of reading downloaded files")
+    args = parser.parse_args()
+    
     try:
         print("\n=== Starting IMDb Data Import Process ===")
         importer = IMDbDataImporter()
+        importer.source = args.stream
         
-        print("\nStep 1/7: Initializing...")
-        
-        print("\nStep 2/7: Clearing existing data...")
-        importer.clear_tables()
-        
-        print("\nStep 3/7: Importing media data...")
-        importer.import_media()
-        
-        print("\nStep 4/7: Importing people data...")
-        importer.import_people()
-        
-        print("\nStep 5/7: Importing genres data...")
-        importer.import_genres()
-        
-        print("\nStep 6/7: Importing relationships...")
-        print("- Importing ratings...")
-        importer.import_ratings()
-        print("- Importing media-people relationships...")
-        importer.import_media_people()
-        
-        print("\nStep 7/7: Importing media-genre relationships...")
-        importer.import_media_genres()
+        run_import(importer, full=args.full)
         
+        importer.report_timings()
         logging.info("Data import completed successfully")
         print("\n✅ All data imported successfully!")
         print("Check the log file for detailed information.")
@@ -0,0 +1,66 @@
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+
+# Allow running as a script from the helpers directory
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from db import connect
+from workers import refresh_users
+
+
+DB_PATH = Path(r"D:\Programming\What To Watch\wtwData\movies.db")
+
+
+def select_users(db_path, since=None):
+    """All user ids, or only those whose recommender inputs changed since `since`"""
+    conn = connect(db_path, role='read')
+    try:
+        if since is None:
+            rows = conn.execute('SELECT id FROM users ORDER BY id').fetchall()
+        else:
+            # Bumped by every endpoint that changes recommender inputs, deletes included
+            rows = conn.execute(
+                'SELECT id FROM users WHERE inputs_changed_at >= ? ORDER BY id', [since]
+            ).fetchall()
+        return [row[0] for row in rows]
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Recompute stored recommendations for every user, e.g. after the nightly IMDb import"
+    )
+    parser.add_argument('--db', default=str(DB_PATH), help="Path to movies.db")
+    parser.add_argument('--since', help="Only users changed since this UTC timestamp (YYYY-MM-DD[ HH:MM:SS])")
+    parser.add_argument('--processes', type=int, default=None, help="Worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    user_ids = select_users(args.db, args.since)
+    print(f"Recomputing recommendations for {len(user_ids)} users...")
+    logging.info(f"Batch refresh of {len(user_ids)} users started")
+
+    start = time.perf_counter()
+    failed = []
+    for done, (user_id, error) in enumerate(refresh_users(args.db, user_ids, args.processes), 1):
+        if error is not None:
+            failed.append(user_id)
+        if done % 1000 == 0 or done == len(user_ids):
+            print(f"- {done}/{len(user_ids)} users done")
+
+    elapsed = time.perf_counter() - start
+    logging.info(f"Batch refresh of {len(user_ids)} users finished in {elapsed:.1f}s, {len(failed)} failed")
+    if failed:
+        failed.sort()
+        logging.error(f"Recommendation refresh failed for users: {failed}")
+        print(f"❌ Recommendations could not be recomputed for {len(failed)} users: {failed}")
+        sys.exit(1)
+    print(f"✅ Recommendations recomputed in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
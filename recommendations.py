@@ -1,198 +1,279 @@
 import sqlite3
-from collections import defaultdict
-import math
+import threading
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+
+from catalog import CatalogStore
+from db import connect
+from scoring import ScoringEngine
+
+# Fresh candidates re-ranked alongside the stored list on incremental updates
+UPDATE_POOL_SIZE = 500
+
+# Users whose candidate pool is kept between incremental updates, per process
+POOL_CACHE_SIZE = 1024
 
 class MovieRecommender:
-    def __init__(self, db_path):
+    def __init__(self, db_path, catalog=None, connect=None):
         self.db_path = db_path
+        # Shared, process-wide catalog snapshot (see catalog.py)
+        self.catalog = catalog if catalog is not None else CatalogStore(db_path)
+        # Optional connection factory, e.g. the app's pooled connections
+        self.connect = connect
+        # user_id -> (filter key, pool size, pool positions) for _pools_snapshot,
+        # least recently used first
+        self._pools = OrderedDict()
+        self._pools_snapshot = None
+        self._pools_lock = threading.Lock()
         
     def get_db_connection(self):
-        conn = sqlite3.connect(self.db_path)
+        if self.connect is not None:
+            return self.connect()
+        conn = connect(self.db_path, role='write')
         conn.row_factory = sqlite3.Row
         return conn
 
-    def get_recommendations(self, user_id, limit=50):
+    def get_recommendations(self, user_id, limit=50, diff=False):
         conn = self.get_db_connection()  # Fixed method name
         try:
-            # Get user settings
-            settings = conn.execute('''
-                SELECT min_rating, year_from, year_to, 
-                    include_watch_history, include_ratings, include_favorites
-                FROM user_settings 
-                WHERE user_id = ?
-            ''', [user_id]).fetchone()
-            
-            if not settings:
-                settings = {
-                    'min_rating': 6.0,
-                    'year_from': 1900,
-                    'year_to': 2024,
-                    'include_watch_history': True,
-                    'include_ratings': True,
-                    'include_favorites': True
-                }
-
-            # Get user genre preferences
-            genre_preferences = conn.execute('''
-                SELECT genre_id, weight 
-                FROM user_preferences 
-                WHERE user_id = ?
-            ''', [user_id]).fetchall()
-            
-            genre_weights = {row['genre_id']: row['weight'] for row in genre_preferences}
-            
-            # Base query to get eligible movies - FIXED to properly handle ratings and year range
-            base_query = '''
-                SELECT DISTINCT 
-                    m.*,
-                    r.average_rating,
-                    r.num_votes,
-                    GROUP_CONCAT(mg.genre_id) as genre_ids
-                FROM media m
-                JOIN media_genres mg ON m.id = mg.media_id
-                LEFT JOIN ratings r ON m.id = r.media_id  -- Changed to LEFT JOIN to not exclude unrated movies
-                WHERE 1=1
-                    AND (r.average_rating >= ? OR r.average_rating IS NULL)
-                    AND m.year BETWEEN ? AND ?
-                    AND m.id NOT IN (
-                        SELECT media_id FROM watch_history WHERE user_id = ?
-                    )
-                GROUP BY m.id
-                HAVING COUNT(DISTINCT CASE WHEN mg.genre_id IN ({}) THEN mg.genre_id ELSE NULL END) > 0
-            '''.format(','.join('?' * len(genre_weights)) if genre_weights else '0')
-            
-            params = [
-                settings['min_rating'],
-                settings['year_from'],
-                settings['year_to'],
-                user_id
-            ]
-            
-            if genre_weights:
-                params.extend(list(genre_weights.keys()))
+            recommendations = self.rank_for_user(conn, user_id, limit)
 
-            movies = conn.execute(base_query, params).fetchall()
-            
-            # Calculate scores for each movie
-            scored_movies = []
-            for movie in movies:
-                movie_dict = dict(movie)
-                score = self.calculate_movie_score(
-                    conn,
-                    movie_dict,
-                    user_id,
-                    genre_weights,
-                    settings['include_watch_history'],
-                    settings['include_favorites']
-                )
-                
-                if score > 0:
-                    scored_movies.append({
-                        'movie': movie_dict,
-                        'score': score
-                    })
+            # Store recommendations
+            self.store_recommendations(conn, user_id, recommendations, diff=diff)
 
-            # Sort by score and limit results
-            scored_movies.sort(key=lambda x: x['score'], reverse=True)
-            recommendations = scored_movies[:limit]
+            return recommendations
 
-            # Store recommendations
-            self.store_recommendations(conn, user_id, recommendations)
+        finally:
+            conn.close()
+
+    def update_recommendations(self, user_id, limit=50, pool_size=UPDATE_POOL_SIZE):
+        """Incrementally refresh stored recommendations after a user event.
+
+        Watching, rating or favoriting only moves a few titles, so instead
+        of ranking every candidate this re-ranks the stored list plus the
+        `pool_size` candidates with the best genre/rating score. That pool
+        depends only on the catalog snapshot, the rating/year filters and
+        the genre weights, so it is cached per user (see candidate_pool)
+        and the catalog is only scanned again when one of those changes.
+        Watched titles drop out through the normal filters and the
+        history/favorites genre sets are rebuilt from the catalog snapshot.
+        """
+        conn = self.get_db_connection()
+        try:
+            stored_ids = [
+                row['media_id'] for row in conn.execute('''
+                    SELECT media_id FROM user_recommendations WHERE user_id = ?
+                ''', [user_id])
+            ]
+            recommendations = self.rank_for_user(
+                conn, user_id, limit, keep_ids=stored_ids, pool_size=pool_size
+            )
+            self.store_recommendations(conn, user_id, recommendations, diff=True)
 
             return recommendations
 
         finally:
             conn.close()
+
+    def rank_for_user(self, conn, user_id, limit, keep_ids=None, pool_size=None):
+        """Top `limit` movie/score dicts for a user.
+
+        With `pool_size`, only `keep_ids` plus the best `pool_size`
+        candidates by base score are filtered and scored.
+        """
+        # Get user settings
+        settings = conn.execute('''
+            SELECT min_rating, year_from, year_to, 
+                include_watch_history, include_ratings, include_favorites
+            FROM user_settings 
+            WHERE user_id = ?
+        ''', [user_id]).fetchone()
         
-        
-    def calculate_movie_score(self, conn, movie, user_id, genre_weights, use_history, use_favorites):
-        score = 0
-        movie_genres = set(map(int, str(movie['genre_ids']).split(','))) if movie['genre_ids'] else set()
-        
-        # Base score from genre preferences (30% of total score)
-        genre_score = 0
-        for genre_id in movie_genres:
-            if genre_id in genre_weights:
-                genre_score += genre_weights[genre_id]
-
-        # Normalize genre score
-        if len(movie_genres) > 0:
-            genre_score = genre_score / len(movie_genres)
-        score += genre_score * 0.3
-
-        # Rating contribution (40% of total score)
-        if movie['average_rating'] is not None:
-            rating_score = (float(movie['average_rating']) - 5) / 5  # Normalize 5-10 rating to 0-1
-            # Consider number of votes for rating reliability
-            if movie['num_votes']:
-                vote_weight = min(1.0, math.log10(float(movie['num_votes']) + 1) / 4)
-                rating_score *= vote_weight
-            score += rating_score * 0.4
-
-        # Historical preferences (15% of total score)
-        if use_history:
-            history_score = self.calculate_history_similarity(conn, user_id, movie_genres)
-            score += history_score * 0.15
-
-        # Favorites similarity (15% of total score)
-        if use_favorites:
-            favorites_score = self.calculate_favorites_similarity(conn, user_id, movie_genres)
-            score += favorites_score * 0.15
-
-        return score
-
-    def calculate_history_similarity(self, conn, user_id, movie_genres):
-        # Get genres from user's watch history
-        history_genres = conn.execute('''
-            SELECT DISTINCT mg.genre_id
-            FROM watch_history wh
-            JOIN media_genres mg ON wh.media_id = mg.media_id
-            WHERE wh.user_id = ?
+        if not settings:
+            settings = {
+                'min_rating': 6.0,
+                'year_from': 1900,
+                'year_to': 2024,
+                'include_watch_history': True,
+                'include_ratings': True,
+                'include_favorites': True
+            }
+
+        # Get user genre preferences
+        genre_preferences = conn.execute('''
+            SELECT genre_id, weight 
+            FROM user_preferences 
+            WHERE user_id = ?
         ''', [user_id]).fetchall()
         
-        history_genres = set(row['genre_id'] for row in history_genres)
-        
-        if not history_genres:
-            return 0
-            
-        # Calculate Jaccard similarity
-        intersection = len(movie_genres & history_genres)
-        union = len(movie_genres | history_genres)
+        genre_weights = {row['genre_id']: row['weight'] for row in genre_preferences}
         
-        return intersection / union if union > 0 else 0
-
-    def calculate_favorites_similarity(self, conn, user_id, movie_genres):
-        # Get genres from user's favorites
-        favorites_genres = conn.execute('''
-            SELECT DISTINCT mg.genre_id
-            FROM favorites f
-            JOIN media_genres mg ON f.item_id = mg.media_id
-            WHERE f.user_id = ? AND f.item_type = 'media'
+        watched_ids = self.get_watched_ids(conn, user_id)
+        favorite_ids = (
+            self.get_favorite_ids(conn, user_id)
+            if settings['include_favorites'] else None
+        )
+
+        # Filter and score against the in-memory catalog snapshot
+        snapshot = self.catalog.get()
+        if pool_size is None:
+            candidates = self.filter_candidates(snapshot, settings, genre_weights, watched_ids)
+        else:
+            pool = self.candidate_pool(snapshot, user_id, settings, genre_weights, pool_size, len(watched_ids))
+            positions = np.union1d(pool, snapshot.positions(keep_ids or []))
+            candidates = self.filter_candidates(snapshot, settings, genre_weights, watched_ids, positions)
+
+        history_genres = (
+            snapshot.genres_of(watched_ids)
+            if settings['include_watch_history'] else None
+        )
+        favorites_genres = (
+            snapshot.genres_of(favorite_ids)
+            if favorite_ids is not None else None
+        )
+
+        return self.score_movies(
+            snapshot,
+            candidates,
+            genre_weights,
+            history_genres,
+            favorites_genres,
+            limit
+        )
+
+    def filter_candidates(self, snapshot, settings, genre_weights, watched_ids, positions=None):
+        """Positions of unwatched titles matching the rating, year and genre filters.
+
+        The whole catalog is checked, or only `positions` (ascending) if given.
+        """
+        rows = slice(None) if positions is None else positions
+        # At least one preferred genre (titles without genres never qualify)
+        keep = (snapshot.genre_masks[rows] & snapshot.genre_bits.mask(genre_weights)) != 0
+        # Unrated titles are kept, like the old LEFT JOIN on ratings
+        ratings = snapshot.ratings[rows]
+        keep &= np.isnan(ratings) | (ratings >= float(settings['min_rating']))
+        keep &= snapshot.in_year_range(settings['year_from'], settings['year_to'], positions)
+
+        if positions is None:
+            keep[snapshot.positions(watched_ids)] = False
+            return np.flatnonzero(keep)
+        keep &= ~np.isin(positions, snapshot.positions(watched_ids))
+        return positions[keep]
+
+    def candidate_pool(self, snapshot, user_id, settings, genre_weights, pool_size, watched_count=0):
+        """Positions of the best titles by genre/rating score, ascending.
+
+        Only the rating, year and genre filters apply; callers drop watched
+        titles, so `watched_count` extra titles are taken to leave about
+        `pool_size` unwatched ones. Pools are cached per user while the
+        snapshot, the filters and the genre weights stay the same, and reused
+        until the titles watched since would leave less than half of
+        `pool_size`, so repeated updates skip the catalog-wide scan. A new
+        snapshot empties the cache.
+        """
+        key = (
+            float(settings['min_rating']), int(settings['year_from']), int(settings['year_to']),
+            tuple(sorted(genre_weights.items()))
+        )
+        with self._pools_lock:
+            if self._pools_snapshot is not snapshot:
+                # Pools from an older catalog can never be used again
+                self._pools.clear()
+                self._pools_snapshot = snapshot
+            cached = self._pools.get(user_id)
+            if cached is not None and cached[0] == key and cached[1] - watched_count >= pool_size // 2:
+                self._pools.move_to_end(user_id)
+                return cached[2]
+
+        size = pool_size + watched_count
+        candidates = self.filter_candidates(snapshot, settings, genre_weights, [])
+        if len(candidates) > size:
+            base = ScoringEngine.for_positions(snapshot, candidates).base_scores(genre_weights)
+            best = np.argpartition(base, len(base) - size)[len(base) - size:]
+            # Keep ascending catalog order so ties rank as in a full refresh
+            candidates = candidates[np.sort(best)]
+
+        with self._pools_lock:
+            if self._pools_snapshot is snapshot:
+                self._pools[user_id] = (key, size, candidates)
+                self._pools.move_to_end(user_id)
+                while len(self._pools) > POOL_CACHE_SIZE:
+                    self._pools.popitem(last=False)
+        return candidates
+
+    def score_movies(self, snapshot, candidates, genre_weights, history_genres, favorites_genres, limit):
+        """Score the candidate positions and return the top `limit` as movie/score dicts.
+
+        `history_genres` / `favorites_genres` are None when the matching
+        setting is disabled, so those terms are skipped entirely.
+        """
+        engine = ScoringEngine.for_positions(snapshot, candidates)
+        rows, scores = engine.top_k(genre_weights, history_genres, favorites_genres, limit)
+
+        return [
+            {'movie': snapshot.media_dict(candidates[row]), 'score': float(score)}
+            for row, score in zip(rows, scores)
+        ]
+
+    def get_watched_ids(self, conn, user_id):
+        """Media ids in the user's watch history"""
+        rows = conn.execute('''
+            SELECT media_id FROM watch_history WHERE user_id = ?
         ''', [user_id]).fetchall()
-        
-        favorites_genres = set(row['genre_id'] for row in favorites_genres)
-        
-        if not favorites_genres:
-            return 0
-            
-        # Calculate Jaccard similarity with higher weight
-        intersection = len(movie_genres & favorites_genres)
-        union = len(movie_genres | favorites_genres)
-        
-        return 1.5 * (intersection / union) if union > 0 else 0
 
-    def store_recommendations(self, conn, user_id, recommendations):
-        # Clear old recommendations
-        conn.execute('DELETE FROM user_recommendations WHERE user_id = ?', [user_id])
-        
-        # Store new recommendations
-        for rank, rec in enumerate(recommendations, 1):
-            conn.execute('''
-                INSERT INTO user_recommendations (user_id, media_id, score, rank)
+        return [row['media_id'] for row in rows]
+
+    def get_favorite_ids(self, conn, user_id):
+        """Media ids in the user's favorites"""
+        rows = conn.execute('''
+            SELECT item_id FROM favorites
+            WHERE user_id = ? AND item_type = 'media'
+        ''', [user_id]).fetchall()
+
+        return [row['item_id'] for row in rows]
+
+    def store_recommendations(self, conn, user_id, recommendations, diff=False):
+        """Replace the user's stored recommendations in one transaction.
+
+        With `diff`, only rows that were added, dropped or whose rank/score
+        changed are written, which keeps repeated refreshes cheap.
+        """
+        rows = [
+            (rec['score'], rank, user_id, rec['movie']['id'])
+            for rank, rec in enumerate(recommendations, 1)
+        ]
+
+        with conn:
+            if not diff:
+                # Clear old recommendations and store the new ones
+                conn.execute('DELETE FROM user_recommendations WHERE user_id = ?', [user_id])
+                conn.executemany('''
+                    INSERT INTO user_recommendations (score, rank, user_id, media_id)
+                    VALUES (?, ?, ?, ?)
+                ''', rows)
+                return
+
+            current = {
+                row[0]: (row[1], row[2])
+                for row in conn.execute('''
+                    SELECT media_id, score, rank FROM user_recommendations WHERE user_id = ?
+                ''', [user_id])
+            }
+            new_ids = {row[3] for row in rows}
+
+            conn.executemany(
+                'DELETE FROM user_recommendations WHERE user_id = ? AND media_id = ?',
+                [(user_id, media_id) for media_id in current if media_id not in new_ids]
+            )
+            conn.executemany('''
+                UPDATE user_recommendations SET score = ?, rank = ?
+                WHERE user_id = ? AND media_id = ?
+            ''', [row for row in rows if row[3] in current and current[row[3]] != row[:2]])
+            conn.executemany('''
+                INSERT INTO user_recommendations (score, rank, user_id, media_id)
                 VALUES (?, ?, ?, ?)
-            ''', [user_id, rec['movie']['id'], rec['score'], rank])
-        
-        conn.commit()
+            ''', [row for row in rows if row[3] not in current])
 
     def get_stored_recommendations(self, user_id, limit=None):
         """Retrieve stored recommendations for a user"""
@@ -220,4 +301,4 @@ class MovieRecommender:
 
     def refresh_recommendations(self, user_id):
         """Force refresh of user recommendations"""
-        self.get_recommendations(user_id)
\ No newline at end of file
+        self.get_recommendations(user_id, diff=True)
\ No newline at end of file
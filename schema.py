@@ -0,0 +1,255 @@
+from search import normalize_title
+
+# Catalog tables, filled by helpers/imdb_importer.py; parents before children
+CATALOG_TABLES = ['media', 'people', 'genres', 'media_genres', 'media_people', 'ratings']
+
+CATALOG_TABLES_SQL = [
+    '''
+    CREATE TABLE IF NOT EXISTS media (
+        id INTEGER PRIMARY KEY,
+        imdb_id TEXT UNIQUE,
+        title TEXT NOT NULL,
+        original_title TEXT,
+        type TEXT,
+        year INTEGER,
+        runtime_minutes INTEGER,
+        plot TEXT,
+        poster_url TEXT,
+        search_key TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS people (
+        id INTEGER PRIMARY KEY,
+        imdb_id TEXT UNIQUE,
+        name TEXT NOT NULL,
+        birth_year INTEGER,
+        death_year INTEGER,
+        primary_profession TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS genres (
+        id INTEGER PRIMARY KEY,
+        name TEXT UNIQUE NOT NULL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS media_genres (
+        media_id INTEGER NOT NULL REFERENCES media(id),
+        genre_id INTEGER NOT NULL REFERENCES genres(id),
+        PRIMARY KEY (media_id, genre_id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS media_people (
+        media_id INTEGER NOT NULL REFERENCES media(id),
+        person_id INTEGER NOT NULL REFERENCES people(id),
+        role TEXT,
+        character_name TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS ratings (
+        media_id INTEGER PRIMARY KEY REFERENCES media(id),
+        average_rating REAL,
+        num_votes INTEGER
+    )
+    ''',
+]
+
+# User tables, written by the web app
+USER_TABLES_SQL = [
+    '''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        hash TEXT NOT NULL,
+        -- Last change to anything the recommender reads (see touch_recommender_inputs in app.py)
+        inputs_changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS user_settings (
+        user_id INTEGER PRIMARY KEY REFERENCES users(id),
+        min_rating REAL DEFAULT 6.0,
+        year_from INTEGER DEFAULT 1900,
+        year_to INTEGER DEFAULT 2024,
+        include_watch_history BOOLEAN DEFAULT 1,
+        include_ratings BOOLEAN DEFAULT 1,
+        include_favorites BOOLEAN DEFAULT 1,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS user_preferences (
+        user_id INTEGER NOT NULL REFERENCES users(id),
+        genre_id INTEGER NOT NULL REFERENCES genres(id),
+        weight REAL DEFAULT 1.0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, genre_id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS watch_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL REFERENCES users(id),
+        media_id INTEGER NOT NULL REFERENCES media(id),
+        rating INTEGER,
+        watch_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (user_id, media_id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS favorites (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL REFERENCES users(id),
+        item_id INTEGER NOT NULL,
+        item_type TEXT NOT NULL DEFAULT 'media',
+        date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (user_id, item_id, item_type)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS watchlist (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL REFERENCES users(id),
+        media_id INTEGER NOT NULL REFERENCES media(id),
+        priority INTEGER DEFAULT 1,
+        date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (user_id, media_id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS user_recommendations (
+        user_id INTEGER NOT NULL REFERENCES users(id),
+        media_id INTEGER NOT NULL REFERENCES media(id),
+        score REAL,
+        rank INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, media_id)
+    )
+    ''',
+    # Recommendation refreshes queued or running in any app process (see workers.py)
+    '''
+    CREATE TABLE IF NOT EXISTS recommendation_jobs (
+        user_id INTEGER PRIMARY KEY REFERENCES users(id),
+        queued_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        -- Job to run again once this one finishes: 0 none, 1 update, 2 full refresh
+        rerun INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+]
+
+# Import bookkeeping, kept across catalog swaps
+IMPORT_TABLES_SQL = [
+    # Highest id ever given out per catalog table whose ids are kept across
+    # imports, so ids of dropped rows are never reused (see helpers/imdb_importer.py)
+    '''
+    CREATE TABLE IF NOT EXISTS catalog_id_marks (
+        table_name TEXT PRIMARY KEY,
+        last_id INTEGER NOT NULL
+    )
+    ''',
+]
+
+# Secondary indexes on catalog tables: (name, table, columns)
+CATALOG_INDEXES = [
+    ('idx_media_type_search_key', 'media', 'type, search_key'),
+    ('idx_media_genres_genre', 'media_genres', 'genre_id, media_id'),
+    ('idx_ratings_media', 'ratings', 'media_id, average_rating, num_votes'),
+    ('idx_media_people_media', 'media_people', 'media_id, person_id'),
+]
+
+# Secondary indexes on user tables, covering the hot lookups and joins
+USER_INDEXES = [
+    ('idx_watch_history_user', 'watch_history', 'user_id, media_id'),
+    ('idx_favorites_user', 'favorites', 'user_id, item_type, item_id'),
+    ('idx_watchlist_user', 'watchlist', 'user_id, priority, date_added'),
+    ('idx_user_recommendations_rank', 'user_recommendations', 'user_id, rank'),
+]
+
+
+def register_functions(conn):
+    """SQL access to the Python title normalization used for search_key"""
+    conn.create_function('normalize_title', 1, normalize_title, deterministic=True)
+
+
+def shadow_table_sql(table, shadow):
+    """CREATE statement for an empty copy of catalog `table` named `shadow`"""
+    for statement in CATALOG_TABLES_SQL:
+        if f'EXISTS {table} (' in statement:
+            return statement.replace(f'EXISTS {table} (', f'EXISTS {shadow} (', 1)
+    raise KeyError(table)
+
+
+def create_tables(conn, statements):
+    for statement in statements:
+        conn.execute(statement)
+
+
+def shadow_index_name(name):
+    """Second name of a catalog index, used while the live catalog holds the first"""
+    return f'{name}_shadow'
+
+
+def _index_tables(conn):
+    return dict(conn.execute("SELECT name, tbl_name FROM sqlite_master WHERE type = 'index'"))
+
+
+def create_indexes(conn, indexes):
+    """Create missing indexes; one present under its shadow name counts as present"""
+    existing = _index_tables(conn)
+    for name, table, columns in indexes:
+        if existing.get(shadow_index_name(name)) == table:
+            continue
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})')
+
+
+def create_shadow_indexes(conn, indexes):
+    """Create catalog indexes on the <table>_shadow copies of their tables.
+
+    Each goes under whichever of its two names the live index is not
+    using, so it keeps that name when the shadow is renamed into place.
+    """
+    existing = _index_tables(conn)
+    for name, table, columns in indexes:
+        if name in existing:
+            name = shadow_index_name(name)
+        conn.execute(f'CREATE INDEX {name} ON {table}_shadow ({columns})')
+
+
+def drop_indexes(conn, indexes):
+    for name, _, _ in indexes:
+        conn.execute(f'DROP INDEX IF EXISTS {name}')
+        conn.execute(f'DROP INDEX IF EXISTS {shadow_index_name(name)}')
+
+
+def ensure_schema(conn):
+    """Create missing tables, columns and indexes; safe to run on every start.
+
+    Databases created before search_key existed get the column added and
+    backfilled from the titles. Users from before inputs_changed_at count as
+    changed now, so the next incremental precompute covers them once.
+    """
+    create_tables(conn, CATALOG_TABLES_SQL + USER_TABLES_SQL + IMPORT_TABLES_SQL)
+
+    user_columns = {row[1] for row in conn.execute('PRAGMA table_info(users)')}
+    if 'inputs_changed_at' not in user_columns:
+        # ADD COLUMN cannot default to CURRENT_TIMESTAMP
+        conn.execute('ALTER TABLE users ADD COLUMN inputs_changed_at TIMESTAMP')
+        conn.execute('UPDATE users SET inputs_changed_at = CURRENT_TIMESTAMP')
+
+    job_columns = {row[1] for row in conn.execute('PRAGMA table_info(recommendation_jobs)')}
+    if 'rerun' not in job_columns:
+        conn.execute('ALTER TABLE recommendation_jobs ADD COLUMN rerun INTEGER NOT NULL DEFAULT 0')
+
+    media_columns = {row[1] for row in conn.execute('PRAGMA table_info(media)')}
+    if 'search_key' not in media_columns:
+        conn.execute('ALTER TABLE media ADD COLUMN search_key TEXT')
+    if conn.execute('SELECT 1 FROM media WHERE search_key IS NULL LIMIT 1').fetchone():
+        register_functions(conn)
+        conn.execute('UPDATE media SET search_key = normalize_title(title) WHERE search_key IS NULL')
+
+    create_indexes(conn, CATALOG_INDEXES + USER_INDEXES)
+    conn.commit()
@@ -0,0 +1,448 @@
+import logging
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+
+import numpy as np
+
+from catalog import TYPE_CODES
+
+# Full-text index over the searchable media fields. rowid is media.id; type
+# is stored unindexed so search can filter on it without joining first.
+SEARCH_INDEX_SQL = '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS media_fts USING fts5(
+        title, original_title, plot, genres, type UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+'''
+
+# Keep media_fts in step with edits made outside the importer
+SEARCH_TRIGGERS_SQL = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS media_fts_insert AFTER INSERT ON media BEGIN
+        INSERT INTO media_fts (rowid, title, original_title, plot, genres, type)
+        VALUES (NEW.id, NEW.title, NEW.original_title, NEW.plot, '', NEW.type);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS media_fts_update AFTER UPDATE ON media BEGIN
+        UPDATE media_fts
+        SET title = NEW.title, original_title = NEW.original_title,
+            plot = NEW.plot, type = NEW.type
+        WHERE rowid = NEW.id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS media_fts_delete AFTER DELETE ON media BEGIN
+        DELETE FROM media_fts WHERE rowid = OLD.id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS media_fts_genres_insert AFTER INSERT ON media_genres BEGIN
+        UPDATE media_fts SET genres = (
+            SELECT GROUP_CONCAT(g.name, ' ') FROM media_genres mg
+            JOIN genres g ON mg.genre_id = g.id WHERE mg.media_id = NEW.media_id
+        ) WHERE rowid = NEW.media_id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS media_fts_genres_delete AFTER DELETE ON media_genres BEGIN
+        UPDATE media_fts SET genres = COALESCE((
+            SELECT GROUP_CONCAT(g.name, ' ') FROM media_genres mg
+            JOIN genres g ON mg.genre_id = g.id WHERE mg.media_id = OLD.media_id
+        ), '') WHERE rowid = OLD.media_id;
+    END
+    ''',
+]
+
+SEARCH_TRIGGERS = [
+    'media_fts_insert', 'media_fts_update', 'media_fts_delete',
+    'media_fts_genres_insert', 'media_fts_genres_delete'
+]
+
+# bm25 column weights: title, original_title, plot, genres, type
+BM25_WEIGHTS = '10.0, 5.0, 1.0, 2.0, 0.0'
+# Minimum trigram Jaccard similarity for fuzzy title matches
+FUZZY_MIN_SIMILARITY = 0.25
+# BM25 hits considered before the exact-title tie-break in relevance order
+RELEVANCE_CANDIDATES = 200
+
+
+def drop_search_triggers(conn):
+    """Drop the sync triggers; bulk imports rebuild the index once instead"""
+    for trigger in SEARCH_TRIGGERS:
+        conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+
+
+def search_index_sql(suffix=''):
+    """CREATE statement for media_fts, or for a copy named media_fts<suffix>"""
+    return SEARCH_INDEX_SQL.replace('EXISTS media_fts ', f'EXISTS media_fts{suffix} ', 1)
+
+
+def search_rows_sql(suffix=''):
+    """INSERT filling media_fts<suffix> from media<suffix> and its genre tables.
+
+    Only titles with ids in [:low, :high] are added, so large catalogs can be
+    indexed in batches.
+    """
+    return f'''
+        INSERT INTO media_fts{suffix} (rowid, title, original_title, plot, genres, type)
+        SELECT m.id, m.title, m.original_title, m.plot,
+            COALESCE(mg.genres, ''), m.type
+        FROM media{suffix} m
+        LEFT JOIN (
+            SELECT mg.media_id, GROUP_CONCAT(g.name, ' ') AS genres
+            FROM media_genres{suffix} mg
+            JOIN genres{suffix} g ON mg.genre_id = g.id
+            WHERE mg.media_id BETWEEN :low AND :high
+            GROUP BY mg.media_id
+        ) mg ON mg.media_id = m.id
+        WHERE m.id BETWEEN :low AND :high
+    '''
+
+
+def create_search_triggers(conn):
+    for statement in SEARCH_TRIGGERS_SQL:
+        conn.execute(statement)
+
+
+def rebuild_search_index(conn):
+    """(Re)create media_fts from the catalog tables and install the sync triggers"""
+    conn.execute(SEARCH_INDEX_SQL)
+    drop_search_triggers(conn)
+    conn.execute('DELETE FROM media_fts')
+    conn.execute(search_rows_sql(), {'low': -2 ** 63, 'high': 2 ** 63 - 1})
+    conn.execute("INSERT INTO media_fts (media_fts) VALUES ('optimize')")
+    create_search_triggers(conn)
+    conn.commit()
+
+
+def fts_query(query):
+    """Turn free text into an FTS5 query: every word must match, as a prefix"""
+    terms = re.findall(r'\w+', query)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def has_search_index(conn):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'media_fts'"
+    ).fetchone() is not None
+
+
+SEARCH_SELECT = '''
+    SELECT
+        m.*,
+        r.average_rating,
+        r.num_votes,
+        GROUP_CONCAT(DISTINCT g.name) as genres,
+        CASE WHEN f.id IS NOT NULL THEN 1 ELSE 0 END as is_favorite,
+        CASE WHEN w.id IS NOT NULL THEN 1 ELSE 0 END as in_watchlist
+'''
+
+SEARCH_JOINS = '''
+    LEFT JOIN ratings r ON m.id = r.media_id
+    LEFT JOIN media_genres mg ON m.id = mg.media_id
+    LEFT JOIN genres g ON mg.genre_id = g.id
+    LEFT JOIN favorites f ON m.id = f.item_id
+        AND f.user_id = ?
+        AND f.item_type = 'media'
+    LEFT JOIN watchlist w ON m.id = w.media_id
+        AND w.user_id = ?
+'''
+
+SORT_ORDERS = {
+    'rating': 'r.average_rating DESC NULLS LAST, m.title',
+    'year': 'm.year DESC, m.title',
+    'title': 'm.title',
+}
+
+
+def search_media(conn, user_id, query, search_type, sort_by='relevance', limit=20):
+    """Search media by title, original title, plot and genre names.
+
+    Uses the media_fts index with BM25 relevance when it exists and falls
+    back to LIKE scanning for databases the importer has not indexed yet.
+    """
+    if has_search_index(conn):
+        return _search_fts(conn, user_id, query, search_type, sort_by, limit)
+    return _search_like(conn, user_id, query, search_type, sort_by, limit)
+
+
+def search_media_by_ids(conn, user_id, media_ids):
+    """Search result rows for the given media ids, in the same order"""
+    if not media_ids:
+        return []
+    placeholders = ','.join('?' * len(media_ids))
+    sql = SEARCH_SELECT + '''
+        FROM media m
+    ''' + SEARCH_JOINS + f'''
+        WHERE m.id IN ({placeholders})
+        GROUP BY m.id
+    '''
+    rows = {row['id']: row for row in conn.execute(sql, [user_id, user_id] + list(media_ids))}
+    return [rows[media_id] for media_id in media_ids if media_id in rows]
+
+
+def suggest_titles(conn, prefix, media_type, limit=10):
+    """(title, year) rows of titles starting with `prefix`, ranked like TitlePrefixIndex.suggest.
+
+    Served from the search_key index while the in-memory prefix index is
+    still being built.
+    """
+    key = normalize_title(prefix)
+    if not key:
+        return []
+    # The most voted matches, then exact matches first, as the index does
+    return conn.execute('''
+        SELECT title, year FROM (
+            SELECT m.title, m.year, m.search_key, COALESCE(r.num_votes, 0) AS votes
+            FROM media m
+            LEFT JOIN ratings r ON r.media_id = m.id
+            WHERE m.type = ? AND m.search_key >= ? AND m.search_key < ?
+            ORDER BY votes DESC
+            LIMIT ?
+        )
+        ORDER BY search_key = ? DESC, votes DESC, search_key
+    ''', [media_type, key, key + '\U0010ffff', limit, key]).fetchall()
+
+
+def _search_fts(conn, user_id, query, search_type, sort_by, limit):
+    match = fts_query(query)
+    if not match:
+        return []
+
+    order = SORT_ORDERS.get(sort_by)
+    if order is None:  # relevance
+        # Exact title matches first, then BM25 (lower is better). Only the
+        # best-ranked hits are joined, so common words stay cheap.
+        order = 'm.search_key = ? DESC, hits.relevance, r.average_rating DESC NULLS LAST, m.title'
+        order_params = [normalize_title(query)]
+        hits_limit = f'ORDER BY relevance LIMIT {RELEVANCE_CANDIDATES}'
+    else:
+        order_params = []
+        hits_limit = ''
+
+    sql = SEARCH_SELECT + f'''
+        FROM (
+            SELECT rowid AS media_id, bm25(media_fts, {BM25_WEIGHTS}) AS relevance
+            FROM media_fts
+            WHERE media_fts MATCH ? AND type = ?
+            {hits_limit}
+        ) hits
+        JOIN media m ON m.id = hits.media_id
+    ''' + SEARCH_JOINS + f'''
+        GROUP BY m.id
+        ORDER BY {order}
+        LIMIT ?
+    '''
+    params = [match, search_type, user_id, user_id] + order_params + [limit]
+    return conn.execute(sql, params).fetchall()
+
+
+def _search_like(conn, user_id, query, search_type, sort_by, limit):
+    sql = SEARCH_SELECT + '''
+        FROM media m
+    ''' + SEARCH_JOINS + '''
+        WHERE m.type = ? AND (
+            m.search_key LIKE ? OR
+            LOWER(m.plot) LIKE LOWER(?) OR
+            EXISTS (
+                SELECT 1 FROM media_genres mg2
+                JOIN genres g2 ON mg2.genre_id = g2.id
+                WHERE mg2.media_id = m.id AND LOWER(g2.name) LIKE LOWER(?)
+            )
+        )
+        GROUP BY m.id
+    '''
+    key = normalize_title(query)
+    params = [user_id, user_id, search_type, f'%{key}%', f'%{query}%', f'%{query}%']
+
+    order = SORT_ORDERS.get(sort_by)
+    if order is not None:
+        sql += f' ORDER BY {order}'
+    else:  # relevance
+        sql += '''
+            ORDER BY
+                CASE
+                    WHEN m.search_key = ? THEN 1
+                    WHEN m.search_key >= ? AND m.search_key < ? THEN 2
+                    WHEN LOWER(m.plot) LIKE LOWER(?) THEN 3
+                    ELSE 4
+                END,
+                r.average_rating DESC NULLS LAST,
+                m.title
+        '''
+        params.extend([key, key, key + '\U0010ffff', f'%{query}%'])
+
+    sql += ' LIMIT ?'
+    params.append(limit)
+    return conn.execute(sql, params).fetchall()
+
+
+def normalize_title(title):
+    """Lowercase, accent-stripped title with punctuation collapsed to single spaces"""
+    folded = unicodedata.normalize('NFKD', title or '')
+    folded = ''.join(ch for ch in folded if not unicodedata.combining(ch)).lower()
+    return ' '.join(re.findall(r'\w+', folded))
+
+
+class TitlePrefixIndex:
+    """Sorted normalized titles per media type, for prefix autocomplete.
+
+    A prefix maps to a contiguous range of the sorted keys (two bisects);
+    the most-voted titles in that range are picked with argpartition.
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        offsets = snapshot.title_offsets
+        blob = snapshot.titles.tobytes()
+        keys = [normalize_title(blob[offsets[i]:offsets[i + 1]].decode('utf-8'))
+                for i in range(len(snapshot))]
+
+        self.keys = {}
+        self.positions = {}
+        self.votes = {}
+        for type_name, type_code in TYPE_CODES.items():
+            positions = np.flatnonzero(snapshot.types == type_code)
+            order = sorted(positions.tolist(), key=keys.__getitem__)
+            self.keys[type_name] = [keys[position] for position in order]
+            self.positions[type_name] = np.asarray(order, dtype=np.int64)
+            self.votes[type_name] = snapshot.votes[self.positions[type_name]]
+
+    def suggest(self, prefix, media_type, limit=10):
+        """Catalog positions of the best `limit` titles starting with `prefix`"""
+        keys = self.keys.get(media_type)
+        key = normalize_title(prefix)
+        if not keys or not key:
+            return []
+
+        lo = bisect_left(keys, key)
+        hi = bisect_left(keys, key + '\U0010ffff', lo)
+        if lo == hi:
+            return []
+
+        votes = self.votes[media_type][lo:hi]
+        if len(votes) > limit:
+            best = np.argpartition(-votes, limit - 1)[:limit]
+        else:
+            best = np.arange(len(votes))
+        # Exact matches first, then most voted, then alphabetical
+        best = sorted(best.tolist(), key=lambda i: (keys[lo + i] != key, -int(votes[i]), keys[lo + i]))
+        return [int(self.positions[media_type][lo + i]) for i in best]
+
+
+def title_trigrams(key):
+    """Trigrams of a normalized title, ignoring spaces so "spiderman" matches "spider man" """
+    compact = f"$${key.replace(' ', '')}$"
+    return {compact[i:i + 3] for i in range(len(compact) - 2)}
+
+
+class TrigramIndex:
+    """Inverted trigram index over normalized titles, for typo-tolerant search.
+
+    Postings are stored as one position array grouped by trigram, so a
+    query only touches the posting lists of its own trigrams; the shared
+    trigram counts are tallied with NumPy and ranked by Jaccard
+    similarity, then by votes.
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        offsets = snapshot.title_offsets
+        blob = snapshot.titles.tobytes()
+
+        self.trigram_ids = {}
+        posting_trigrams = []
+        posting_positions = []
+        self.trigram_counts = np.zeros(len(snapshot), dtype=np.int32)
+        for position in range(len(snapshot)):
+            key = normalize_title(blob[offsets[position]:offsets[position + 1]].decode('utf-8'))
+            trigrams = title_trigrams(key) if key else set()
+            self.trigram_counts[position] = len(trigrams)
+            for trigram in trigrams:
+                posting_trigrams.append(self.trigram_ids.setdefault(trigram, len(self.trigram_ids)))
+            posting_positions.extend([position] * len(trigrams))
+
+        posting_trigrams = np.asarray(posting_trigrams, dtype=np.int32)
+        order = np.argsort(posting_trigrams, kind='stable')
+        self.postings = np.asarray(posting_positions, dtype=np.int32)[order]
+        self.posting_offsets = np.zeros(len(self.trigram_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(posting_trigrams, minlength=len(self.trigram_ids)),
+                  out=self.posting_offsets[1:])
+
+    def search(self, query, media_type=None, limit=10, min_similarity=FUZZY_MIN_SIMILARITY):
+        """Catalog positions of the titles most similar to `query`, best first"""
+        key = normalize_title(query)
+        if not key:
+            return []
+        trigrams = title_trigrams(key)
+
+        lists = []
+        for trigram in trigrams:
+            trigram_id = self.trigram_ids.get(trigram)
+            if trigram_id is not None:
+                lists.append(self.postings[self.posting_offsets[trigram_id]:self.posting_offsets[trigram_id + 1]])
+        if not lists:
+            return []
+
+        positions, shared = np.unique(np.concatenate(lists), return_counts=True)
+        if media_type is not None:
+            keep = self.snapshot.types[positions] == TYPE_CODES.get(media_type, -1)
+            positions, shared = positions[keep], shared[keep]
+
+        similarity = shared / (len(trigrams) + self.trigram_counts[positions] - shared)
+        keep = similarity >= min_similarity
+        positions, similarity = positions[keep], similarity[keep]
+
+        order = np.lexsort((-self.snapshot.votes[positions], -similarity))[:limit]
+        return positions[order].tolist()
+
+
+class SnapshotIndexCache:
+    """Holds a search index for the current catalog snapshot.
+
+    Indexes are built in a background thread, so requests never wait on a
+    build: start() begins one at app startup, and get() begins one when the
+    catalog has been reloaded. Until the first build finishes get() returns
+    None and callers fall back to SQL; after a reload it keeps returning the
+    previous index until the new one is ready. Positions from an index belong
+    to its own snapshot (index.snapshot), which may lag the catalog for that
+    long.
+    """
+
+    def __init__(self, index_class):
+        self.index_class = index_class
+        self._index = None
+        self._pending = None  # snapshot being indexed in the background
+        self._lock = threading.Lock()
+
+    def _build_in_background(self, snapshot):
+        try:
+            index = self.index_class(snapshot)
+        except Exception as e:
+            logging.error(f"Building {self.index_class.__name__} failed: {e}")
+            index = None
+        with self._lock:
+            # A newer reload may have queued another build meanwhile
+            if self._pending is snapshot:
+                self._pending = None
+                if index is not None:
+                    self._index = index
+
+    def start(self, snapshot):
+        """Build the index for `snapshot` in the background unless it exists or is underway"""
+        with self._lock:
+            current = self._index.snapshot if self._index is not None else None
+            if current is snapshot or self._pending is snapshot:
+                return
+            self._pending = snapshot
+        threading.Thread(target=self._build_in_background, args=(snapshot,), daemon=True).start()
+
+    def get(self, snapshot):
+        """Latest built index, or None before the first build finishes"""
+        index = self._index
+        if (index is None or index.snapshot is not snapshot) and self._pending is not snapshot:
+            self.start(snapshot)
+        return index
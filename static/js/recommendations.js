@@ -16,6 +16,14 @@ $(document).ready(function() {
             success: async function(response) {
                 await displayResults(response.items);
                 updatePagination(response.current_page, response.total_pages);
+
+                // Refreshes run in the background; poll until the new list is stored
+                if (response.refresh_pending) {
+                    if (refresh) {
+                        MediaUtils.showToast('Refreshing recommendations...');
+                    }
+                    setTimeout(() => loadRecommendations(), 2000);
+                }
             },
             error: function() {
                 MediaUtils.showToast('Error loading recommendations', 'error');
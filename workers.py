@@ -0,0 +1,233 @@
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from db import connect
+from recommendations import MovieRecommender
+
+# Per-process recommender, created once by the pool initializer
+_worker_recommender = None
+
+# A pending refresh older than this is taken as lost (e.g. its app process died)
+JOB_TIMEOUT_SECONDS = 600
+
+# Kinds of job, ordered so a full refresh covers an update (recommendation_jobs.rerun)
+JOB_UPDATE = 1
+JOB_REFRESH = 2
+
+
+def _init_worker(db_path):
+    global _worker_recommender
+    _worker_recommender = MovieRecommender(db_path)
+
+
+def _run(user_id, refresh):
+    """(user_id, None) once `refresh` has run, or (user_id, error message) if it failed.
+
+    Errors are logged and returned rather than raised, so one failing user
+    does not end a batch.
+    """
+    try:
+        refresh(user_id)
+    except Exception as e:
+        logging.error(f"Recommendation refresh failed for user {user_id}: {e}")
+        return user_id, str(e)
+    return user_id, None
+
+
+def _refresh(user_id):
+    return _run(user_id, _worker_recommender.refresh_recommendations)
+
+
+def _update(user_id):
+    return _run(user_id, _worker_recommender.update_recommendations)
+
+
+JOB_FUNCTIONS = {JOB_UPDATE: _update, JOB_REFRESH: _refresh}
+
+
+def refresh_users(db_path, user_ids, processes=None, chunksize=16):
+    """Recompute recommendations for many users across a process pool.
+
+    The catalog snapshot is loaded once in the parent; forked workers
+    inherit it copy-on-write (spawned workers map the same catalog file).
+    Yields (user_id, error) as each refresh completes; error is None on
+    success, else the message of the exception that user's refresh raised.
+    """
+    global _worker_recommender
+    _worker_recommender = MovieRecommender(db_path)
+    _worker_recommender.catalog.load()
+
+    if 'fork' in multiprocessing.get_all_start_methods():
+        pool = multiprocessing.get_context('fork').Pool(processes)
+    else:
+        pool = multiprocessing.get_context('spawn').Pool(processes, _init_worker, (db_path,))
+
+    with pool:
+        yield from pool.imap_unordered(_refresh, user_ids, chunksize)
+
+
+class RecommendationQueue:
+    """Runs recommendation refreshes and updates in a pool of worker processes.
+
+    Pending jobs are recorded in the recommendation_jobs table, so all app
+    processes (e.g. several gunicorn workers) see them: submit() queues a job
+    for a user unless one is already pending in any process. Jobs submitted
+    meanwhile collapse into one rerun after it finishes, so repeated clicks
+    cost at most two jobs and no change made while a job runs is missed.
+    Each worker holds its own MovieRecommender (catalog snapshot and cached
+    candidate pools) for the lifetime of the pool. If a worker process dies,
+    the broken pool is replaced by a new one.
+    """
+
+    def __init__(self, db_path, processes=2, connect=None):
+        self.db_path = db_path
+        self.processes = processes
+        # Optional connection factory, e.g. the app's pooled connections
+        self.connect = connect
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def get_db_connection(self):
+        if self.connect is not None:
+            return self.connect()
+        return connect(self.db_path, role='write')
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn avoids forking a threaded web server with open connections
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(self.db_path,)
+                )
+            return self._executor
+
+    def _discard_executor(self, executor):
+        """Drop a broken pool so the next job starts a new one"""
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+        executor.shutdown(wait=False)
+
+    def _claim(self, user_id, kind):
+        """Record a pending job for `user_id`.
+
+        Returns False if one is already pending; `kind` is then recorded as
+        its rerun.
+        """
+        conn = self.get_db_connection()
+        try:
+            with conn:
+                claimed = conn.execute('''
+                    INSERT INTO recommendation_jobs (user_id, queued_at, rerun)
+                    VALUES (?, CURRENT_TIMESTAMP, 0)
+                    ON CONFLICT (user_id) DO UPDATE SET queued_at = excluded.queued_at, rerun = 0
+                    WHERE queued_at <= datetime('now', ?)
+                ''', [user_id, f'-{JOB_TIMEOUT_SECONDS} seconds']).rowcount
+                if claimed != 1:
+                    conn.execute(
+                        'UPDATE recommendation_jobs SET rerun = MAX(rerun, ?) WHERE user_id = ?',
+                        [kind, user_id]
+                    )
+            return claimed == 1
+        finally:
+            conn.close()
+
+    def _release(self, user_id):
+        conn = self.get_db_connection()
+        try:
+            with conn:
+                conn.execute('DELETE FROM recommendation_jobs WHERE user_id = ?', [user_id])
+        finally:
+            conn.close()
+
+    def _next_job(self, user_id):
+        """Clear the finished job of `user_id`, or keep it claimed for its rerun.
+
+        Returns the kind of job to run again, or 0.
+        """
+        conn = self.get_db_connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute(
+                    'SELECT rerun FROM recommendation_jobs WHERE user_id = ?', [user_id]
+                ).fetchone()
+                rerun = row[0] if row else 0
+                if rerun:
+                    conn.execute('''
+                        UPDATE recommendation_jobs SET queued_at = CURRENT_TIMESTAMP, rerun = 0
+                        WHERE user_id = ?
+                    ''', [user_id])
+                else:
+                    conn.execute('DELETE FROM recommendation_jobs WHERE user_id = ?', [user_id])
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            return rerun
+        finally:
+            conn.close()
+
+    def submit(self, user_id, kind=JOB_REFRESH):
+        """Queue a full refresh (or, with JOB_UPDATE, an incremental update) for `user_id`.
+
+        Returns False if a job is already pending; this one then runs after it.
+        """
+        if not self._claim(user_id, kind):
+            return False
+        self._start(user_id, kind)
+        return True
+
+    def _start(self, user_id, kind):
+        """Run a claimed job in the pool"""
+        try:
+            executor = self._get_executor()
+            try:
+                future = executor.submit(JOB_FUNCTIONS[kind], user_id)
+            except BrokenProcessPool:
+                # A worker died since the last job
+                self._discard_executor(executor)
+                executor = self._get_executor()
+                future = executor.submit(JOB_FUNCTIONS[kind], user_id)
+        except Exception:
+            self._release(user_id)
+            raise
+        future.add_done_callback(lambda f: self._finished(user_id, executor, f))
+
+    def _finished(self, user_id, executor, future):
+        error = future.exception()
+        if isinstance(error, BrokenProcessPool):
+            self._discard_executor(executor)
+        if error is None:
+            error = future.result()[1]
+        if error is not None:
+            logging.error(f"Recommendation refresh failed for user {user_id}: {error}")
+        try:
+            rerun = self._next_job(user_id)
+            if rerun:
+                self._start(user_id, rerun)
+        except Exception as e:
+            logging.error(f"Could not clear the pending refresh of user {user_id}: {e}")
+
+    def is_pending(self, user_id):
+        conn = self.get_db_connection()
+        try:
+            return conn.execute('''
+                SELECT 1 FROM recommendation_jobs
+                WHERE user_id = ? AND queued_at > datetime('now', ?)
+            ''', [user_id, f'-{JOB_TIMEOUT_SECONDS} seconds']).fetchone() is not None
+        finally:
+            conn.close()
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)